@@ -0,0 +1,93 @@
+import sys, time
+import numpy as np
+from GmUtils import GmUtils
+from GmGameRules import GmGameRules
+from basePlayer import basePlayer
+
+# GmGame without a window: plays games between two agents as fast as they can move, for (nightly) regression runs on
+# machines without a display. pygame is not imported.
+# The rules are those of GmGame.runGame: black moves first, a stone can go on any empty cell, a move wins when
+# GmUtils.isWinningMove says so (GmGameRules.winningSeries stones in a row) and the game is a tie when GmUtils.isBoardFull.
+# Unlike GmGame, where an invalid move is skipped, an invalid move (or no move) loses the game, as in the competition.
+# The stones get the values of gomoku.move (2 on odd plies, 1 on even plies), as in the competition and GmQuickTests,
+# so the agents see the same boards as there.
+class GmHeadlessGame:
+    TIE = 0
+    BLACK = 1  # the winner of a game: the player that moved first
+    WHITE = 2
+
+    @staticmethod
+    def runGame(blackPlayer, whitePlayer, max_time_to_move, bsize=None):
+        # Plays one game; the players must have been told their colour with new_game.
+        # Returns the winner (BLACK, WHITE or TIE), the moves, the thinking time per move (ms),
+        # whether the game ended with an invalid move, and the duration of the game (ms).
+        bsize = bsize or GmGameRules.BOARDWIDTH
+        mainBoard = np.zeros((bsize, bsize), dtype=np.int8)
+        last_move = ()
+        ply = 1
+        moves, times = [], []
+        winner, invalid = GmHeadlessGame.TIE, False
+        gameStart = time.perf_counter_ns()
+
+        while True:
+            activePlayer, side = (blackPlayer, GmHeadlessGame.BLACK) if ply % 2 == 1 else (whitePlayer, GmHeadlessGame.WHITE)
+            color = 2 if ply % 2 == 1 else 1
+            start = time.perf_counter_ns()
+            move = activePlayer.move((mainBoard.copy(), ply), last_move, max_time_to_move)
+            times.append((time.perf_counter_ns() - start) / 1e6)
+            if move is None or not GmUtils.isValidMove(mainBoard, move[0], move[1]):
+                winner, invalid = GmHeadlessGame.WHITE if side == GmHeadlessGame.BLACK else GmHeadlessGame.BLACK, True
+                moves.append(move)
+                break
+            last_move = (int(move[0]), int(move[1]))
+            moves.append(last_move)
+            GmUtils.addMoveToBoard(mainBoard, last_move, color)
+            ply += 1
+
+            if GmUtils.isWinningMove(last_move, mainBoard):
+                winner = side
+                break
+            elif GmUtils.isBoardFull(mainBoard):
+                break  # a completely filled board means it's a tie
+
+        return {"winner": winner, "moves": moves, "times": times, "invalid": invalid,
+                "durationMs": (time.perf_counter_ns() - gameStart) / 1e6}
+
+    @staticmethod
+    def playGames(player1, player2, nofGames, max_time_to_move, swapColors=True, bsize=None):
+        # Plays nofGames games between player1 and player2; with swapColors player1 is black in the even games and white in the
+        # odd ones, otherwise always black. Returns the games (runGame results, with "black" the player (1 or 2) that was black
+        # and "score" the points of player1) and a summary: the points, wins, ties, losses and invalid moves of player1, and per
+        # player the number of moves, the mean and slowest thinking time (ms) and the moves over max_time_to_move.
+        games = []
+        for game in range(nofGames):
+            firstIsBlack = not swapColors or game % 2 == 0
+            blackPlayer, whitePlayer = (player1, player2) if firstIsBlack else (player2, player1)
+            blackPlayer.new_game(True)
+            whitePlayer.new_game(False)
+            result = GmHeadlessGame.runGame(blackPlayer, whitePlayer, max_time_to_move, bsize)
+            result["black"] = 1 if firstIsBlack else 2
+            player1Side = GmHeadlessGame.BLACK if firstIsBlack else GmHeadlessGame.WHITE
+            result["score"] = 0.5 if result["winner"] == GmHeadlessGame.TIE else float(result["winner"] == player1Side)
+            games.append(result)
+
+        summary = {"games": nofGames, "score": sum(game["score"] for game in games),
+                   "wins": sum(game["score"] == 1 for game in games), "ties": sum(game["score"] == 0.5 for game in games),
+                   "losses": sum(game["score"] == 0 for game in games), "invalid": sum(game["invalid"] for game in games)}
+        for number in (1, 2):
+            # the moves of player number: the even moves of the games in which it was black, the odd ones otherwise
+            times = [t for game in games for t in game["times"][(game["black"] != number)::2]]
+            summary["player%d" % number] = {"moves": len(times), "meanMs": sum(times) / max(len(times), 1), "maxMs": max(times, default=0.0),
+                                            "overBudget": sum(t > max_time_to_move for t in times)}
+        return games, summary
+
+
+if __name__ == "__main__":
+    # python GmHeadlessGame.py [number of games] [ms per move]: ahmetPlayer against the random basePlayer
+    from ahmet_agent import ahmetPlayer
+
+    nofGames = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    max_time_to_move = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    games, summary = GmHeadlessGame.playGames(ahmetPlayer(), basePlayer(), nofGames, max_time_to_move)
+    print(summary)
+    assert "pygame" not in sys.modules
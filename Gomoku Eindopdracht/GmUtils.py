@@ -1,3 +1,4 @@
+import gomoku
 from GmGameRules import GmGameRules
 
 class GmUtils:
@@ -133,6 +134,15 @@ class GmUtils:
             and (board[row][col] == 0)
         )
 
+    @staticmethod
+    def isBoardFull(board):
+        # Returns True if there are no empty spaces anywhere on the board.
+        for row in range(len(board)):
+            for col in range(len(board[0])):
+                if board[row][col] == 0:
+                    return False
+        return True
+
     @staticmethod
     def addMoveToBoard(board, move, color):
         board[move[0]][move[1]] = color
@@ -179,3 +189,32 @@ class GmUtils:
         #                 dummy=1;dummy=dummy
 
         return validMoves
+
+    @staticmethod
+    def getCandidateMoves(board, ply, distance=2):
+        # The valid moves within a (Chebyshev) distance of a stone, since moves far away from all stones are hardly ever useful.
+        # When there are no such moves (an empty board, or everything near the stones is taken) all valid moves are returned.
+        # This builds a gomoku.CandidateCells index for the one board; search code keeps one up to date move by move instead
+        # (gomoku.SearchState with a radius).
+        candidates = gomoku.CandidateCells(board, distance)
+        if ply == 1 or len(candidates) == 0:
+            return GmUtils.getValidMoves(board, ply)
+        return list(candidates)
+
+    @staticmethod
+    def getCanonicalForm(board, ply):
+        # The square board looks the same after 8 rotations and reflections (the symmetries 0 .. 7 of gomoku.symmetries).
+        # Returns the version of the board with the smallest Zobrist hash, that hash and the symmetry that gives it, so
+        # symmetric positions share one key (for caches and books) and one canonical board.
+        key, symmetry = gomoku.canonical_hash(board, ply)
+        return gomoku.transform_board(board, symmetry), key, symmetry
+
+    @staticmethod
+    def transformMove(move, symmetry, bsize):
+        # A move on the original board, as the same move on the board after the symmetry (for example the canonical form).
+        return gomoku.transform_move(move, symmetry, bsize)
+
+    @staticmethod
+    def untransformMove(move, symmetry, bsize):
+        # A move on the board after the symmetry, back on the original board.
+        return gomoku.inverse_move(move, symmetry, bsize)
@@ -1,28 +1,36 @@
-import gomoku, random, math, time
+import gomoku, gomoku_bitboard, gomoku_patterns, gomoku_rollout, gomoku_threats, random, math, time
+import numpy as np
 from gomoku import Board, Move, GameState
-from copy import deepcopy
+from gomoku_table import TTEntry, TranspositionTable
+from basePlayer import basePlayer
 
 class GameTreeNode:
     """
-    This is a node in the tree used to represent possible game states. It keeps track of the game state, the parent node, the last move made, 
-    valid moves, children of the node, and some statistics for the MCTS algorithm such as the number of visits and the total score.
+    This is a node in the tree used to represent possible game states. It keeps track of the ply, the parent node, the last move made, 
+    the number of valid moves, children of the node, and some statistics for the MCTS algorithm such as the number of visits and the total score.
+    The node does not store a board: the search walks a single gomoku.SearchState down (push) and back up (pop) the tree.
     """
-    def __init__(self, state, parent=None, lastMove=None):
-        self.state      = deepcopy(state)
+    def __init__(self, state, parent=None, lastMove=None, win=None, prior=0):
+        """:param state: the gomoku.SearchState, positioned at this node while the node is created."""
+        self.ply        = state.ply
         self.parent     = parent
-        self.validMoves = gomoku.valid_moves(self.state)
+        self.nValid     = len(state.candidate_moves())
+        self.win        = state.check_win(lastMove) if win is None else win # whether lastMove won the game
         self.lastMove   = lastMove # pointer, for ease of use, corresponding to the previous game state
         self.children   = []       # A container with children, corresponding to possible moves/subsequent game states.
         self.N          = 0        # of visits to the node – this is used for exploration purposes
         self.Q          = 0        # the total number of accrued points, i.e., the number of wins plus 0.5 times the number of draws.
+        self.prior      = prior    # the share of lastMove in the pattern scores of the parent's moves, for PUCT
+        self.amafN      = None     # RAVE: per board cell, the number of roll-outs through this node in which the player to move here played it
+        self.amafQ      = None     # RAVE: per board cell, the accrued points of those roll-outs (both arrays are allocated at the first backup)
 
     def isTerminal(self): 
         """
         Checks whether the current game has ended by looking at winning conditions or an empty list of valid moves.
 
-        Time-Complexity O(1): This is because it simply checks for win conditions and the presence of valid moves, both of which can be determined with fixed, constant-time operations.
+        Time-Complexity O(1): This is because both the win and the number of valid moves were stored when the node was created.
         """
-        if gomoku.check_win(self.state[0], self.lastMove) or len(self.validMoves) == 0:
+        if self.win or self.nValid == 0:
             return True
         return False
 
@@ -30,9 +38,9 @@ class GameTreeNode:
         """
         Checks whether all possible children of the node have been generated.
         
-        Time-Complexity O(1): This comparison involves accessing the lengths of two lists, which are operations that take constant time, regardless of the size of the lists.
+        Time-Complexity O(1): This comparison involves the length of a list and a stored count, which take constant time, regardless of the size of the list.
         """
-        return len(self.children) == len(self.validMoves)
+        return len(self.children) == self.nValid
 
     def UCT(self): 
         """
@@ -43,62 +51,187 @@ class GameTreeNode:
         """
         return (self.Q / self.N) + (1 / math.sqrt(2)) * math.sqrt(2 * math.log(self.parent.N) / self.N)
 
+    def RAVE(self, k, cell):
+        """
+        UCT with the value blended with the all-moves-as-first (AMAF) value of the move, kept by the parent for every cell.
+        The weight of the AMAF value, beta = sqrt(k / (3N + k)), shrinks as the node's own visits grow.
+
+        Time-Complexity O(1): two array lookups on top of UCT.
+        """
+        value = self.Q / self.N
+        amafN = self.parent.amafN[cell]
+        if amafN > 0:
+            beta  = math.sqrt(k / (3 * self.N + k))
+            value = (1 - beta) * value + beta * self.parent.amafQ[cell] / amafN
+        return value + (1 / math.sqrt(2)) * math.sqrt(2 * math.log(self.parent.N) / self.N)
+
+    def PUCT(self, c):
+        """
+        The PUCT score of the node: like UCT, but the exploration term is weighted by the prior of the move, so promising moves
+        get their visits first. c is the exploration constant.
+
+        Time-Complexity O(1): a fixed number of operations on attributes of the node.
+        """
+        return (self.Q / self.N) + c * self.prior * math.sqrt(self.parent.N) / (1 + self.N)
+
+
+class MoveTimer:
+    """
+    The wall-clock budget of a single move, measured with time.perf_counter_ns from the moment the move was requested.
+    tick() is called once per MCTS iteration: it measures how long the iteration took and tells whether another one still fits
+    before the deadline. The safety margin is calibrated from those measurements: the search stops when the slowest iteration
+    of this move (times safetyFactor) would no longer fit, and reserveMs is kept free for choosing and returning the move.
+    Until the move has measured an iteration, expectedNs (an estimate from earlier moves) takes the place of the slowest one.
+    """
+    def __init__(self, max_time_to_move: int, expectedNs: int = 0, reserveMs: float = 10, safetyFactor: float = 2.0, maxIterations: int = None):
+        self.start         = time.perf_counter_ns()
+        self.budgetNs      = int(max_time_to_move * 1000000)
+        self.deadline      = self.start + self.budgetNs - int(reserveMs * 1000000)
+        self.safetyFactor  = safetyFactor
+        self.maxIterations = maxIterations # a fixed number of iterations instead of the deadline, for reproducible debugging
+        self.expectedNs    = expectedNs    # the estimate from earlier moves, until this move has measured its own iterations
+        self.slowestNs     = 0             # the slowest iteration of this move
+        self.iterations    = 0
+        self.last          = self.start
+
+    def tick(self):
+        """
+        Registers the end of an iteration and returns whether there is time for another one.
+
+        Time-Complexity O(1): one clock read and a few comparisons.
+        """
+        now = time.perf_counter_ns()
+        if self.iterations > 0:
+            self.slowestNs = max(self.slowestNs, now - self.last)
+        self.last = now
+        if self.maxIterations is not None:
+            more = self.iterations < self.maxIterations
+        else: # the first iteration only needs the deadline, so a slow iteration of the previous move can't leave this one without a move
+            more = now + self.safetyFactor * (self.slowestNs or self.expectedNs) < self.deadline or (self.iterations == 0 and now < self.deadline)
+        self.iterations += more
+        return more
+
+    def meanNs(self):
+        """The average duration of an iteration of this move."""
+        return (self.last - self.start) // max(self.iterations, 1)
 
-class ahmetPlayer:
+    def report(self):
+        """How much of the budget the move used: elapsed time, budget, number of iterations and the slowest iteration (all in ms)."""
+        usedNs = time.perf_counter_ns() - self.start
+        return {"usedMs": usedNs / 1e6, "budgetMs": self.budgetNs / 1e6, "usedFraction": usedNs / max(self.budgetNs, 1),
+                "iterations": self.iterations, "slowestIterationMs": self.slowestNs / 1e6}
+
+
+class ahmetPlayer(basePlayer):
     """This class specifies a player that just does random moves.
     The use of this class is two-fold: 1) You can use it as a base random roll-out policy.
     2) it specifies the required methods that will be used by the competition to run
     your player
     """
-    def __init__(self, black_: bool = True):
-        """Constructor for the player."""
-        self.black = black_
+    def __init__(self, black_: bool = True, bitboard_: bool = False, maxIterations: int = None, rolloutBatch: int = 1, radius: int = None,
+                 tacticsMs: float = 30, tacticsThrees: bool = False, puct: float = None, rave: float = None, book: str = None, bookPlies: int = 8):
+        """Constructor for the player.
+        With bitboard_=True the search runs on the gomoku_bitboard engine instead of on numpy boards.
+        The search uses the max_time_to_move of every move (wall-clock time), unless maxIterations fixes the number of iterations.
+        With rolloutBatch > 1 every expanded leaf gets that many roll-outs at once (gomoku_rollout.rollout_batch), backed up as one aggregate.
+        With a radius the tree and the (single) roll-outs only consider the empty cells within that Chebyshev distance of a stone (gomoku.CandidateCells).
+        Before the search, up to tacticsMs (at most a tenth of the move's budget, 0 switches it off) is spent on gomoku_threats.forced_move,
+        with open threes as forcing moves when tacticsThrees is set.
+        With puct the untried moves are expanded in the order of their gomoku_patterns score and the children are selected with PUCT
+        (exploration constant puct), using the share of the move in the pattern scores as prior.
+        With rave (the equivalence parameter k of GameTreeNode.RAVE) every node keeps AMAF statistics of the moves played below it,
+        which are blended into UCT and decide the order in which untried moves are expanded. Batched roll-outs (rolloutBatch > 1)
+        don't report their moves, so only the moves in the tree count then.
+        book is the path of an opening book (gomoku_book) that is played from for the first bookPlies plies."""
+        super().__init__(black_, book, bookPlies)
+        self.bitboard = bitboard_
+        self.maxIterations = maxIterations
+        self.rolloutBatch  = rolloutBatch
+        self.radius        = radius
+        self.tacticsMs     = tacticsMs
+        self.tacticsThrees = tacticsThrees
+        self.puct          = puct
+        self.rave          = rave
+        self.playout       = [] # the moves of the last roll-out, for the AMAF statistics
+        self.iterationNs   = 0    # a decaying average of the slowest iteration of the recent moves, to calibrate the first iterations of the next one
+        self.budgetReport  = None # MoveTimer.report() of the last move
+        self.root     = None # the tree of the previous move, positioned after our own move
+        self.search   = None # the SearchState that belongs to self.root
+        self.reused   = 0    # the number of visits that the current root inherited from the previous move
+        gomoku_patterns.pattern_table() # built once per process (it takes tens of ms), here instead of during the first move
+
+    @property
+    def engine(self):
+        """The module the search runs on (a property rather than an attribute, so the player can be pickled)."""
+        return gomoku_bitboard if self.bitboard else gomoku
 
     def new_game(self, black_: bool):
         """At the start of each new game you will be notified by the competition.
         this method has a boolean parameter that informs your agent whether you
         will play black or white.
         """
-        self.black = black_
+        self.black  = black_
+        self.root   = None
+        self.search = None
+        self.iterationNs = 0
+
+    def reuseTree(self, state, last_move):
+        """
+        Returns the SearchState and the root node to search from. If the previous search already expanded the opponent's last_move
+        below our own previous move, that subtree becomes the new root (the rest of the old tree is dropped), otherwise the search starts from a fresh root.
+        The position is compared with the given state, so a mismatch (e.g. a new game without new_game) also gives a fresh root.
+
+        Time-Complexity O(n): comparing the boards takes O(n), finding the opponent's move among the children O(c).
+        """
+        if self.root is not None and last_move:
+            for child in self.root.children:
+                if child.lastMove == tuple(last_move):
+                    self.search.push(child.lastMove)
+                    if self.search.ply == state[1] and np.array_equal(self.search.board, state[0]):
+                        child.parent = None # the new root
+                        self.root    = child
+                        self.reused  = child.N
+                        return self.search, child
+                    break
+
+        self.search = self.engine.SearchState(state, self.radius, self.puct is not None)
+        self.root   = GameTreeNode(self.search, lastMove=last_move)
+        self.reused = 0
+        return self.search, self.root
 
-    def whoWon(self, node, state): 
-        """ Determines who has won the game based on the current state and the last move.
+    def whoWon(self, result, ply): 
+        """ Determines who has won the game based on a result (gomoku_rollout.WIN, LOSS or DRAW) for the player to move at ply.
         Return: Who won, 1 == You, -1 == Opponent, 0 == Draw.
         """
-        if gomoku.check_win(state[0], node.lastMove):
-            if state[1] % 2 != self.black:
-                return 1
-            if state[1] % 2 == self.black:
-                return -1
-        return 0
+        if (ply % 2 == 1) == self.black: # we are the player to move
+            return result
+        return -result
 
-    def findSpotToExpand(self, node): # Algoritme (22) uit de reader.
+    def findSpotToExpand(self, node, state): # Algoritme (22) uit de reader.
         """
         Chooses a node to expand according to the MCTS algorithm. It first tries to find unexplored moves, 
         and otherwise chooses the child node with the highest UCT score.
+        The state must be positioned at node; every step down pushes the move on it, so it ends up positioned at the returned node.
 
-        Time-Complexity O(n): This is because the most significant factor influencing the time complexity is the computation of the list of valid moves, which takes O(n) time. 
-        The other operations within the method, such as iterating over the children or shuffling the list of valid moves, 
-        are relatively minor compared to the linear time complexity of generating the list of valid moves. 
+        Time-Complexity O(n): This is because the most significant factor influencing the time complexity is collecting the untried moves, which takes O(n) time. 
+        The valid moves themselves are a view on the empty-cell index of the state, so they are no longer recomputed. 
         """
         if node.isTerminal(): # returns the root-node if the game has finished
             return node
 
-        valid_moves = gomoku.valid_moves(node.state)
-
         if not node.isFullyExpanded():
-            random.shuffle(valid_moves)
-            action = valid_moves.pop()
-
-            while True:
-                for child in node.children: #find unexplored actions
-                    if child.lastMove == action:
-                        action = valid_moves.pop()
-                break
+            tried   = {child.lastMove for child in node.children}
+            untried = [move for move in state.candidate_moves() if move not in tried] #find unexplored actions
+            if self.puct is not None:
+                action, prior = self.bestPrior(state, untried)
+            elif self.rave is not None and node.amafN is not None:
+                action, prior = self.bestAMAF(node, state, untried), 0
+            else:
+                action, prior = random.choice(untried), 0
 
-            _, _, state = gomoku.move(deepcopy(node.state), action)
+            _, win = state.push(action)
 
-            newChildNode = GameTreeNode(state, node, action)
+            newChildNode = GameTreeNode(state, node, action, win, prior)
             node.children.append(newChildNode)
 
             return newChildNode
@@ -107,71 +240,475 @@ class ahmetPlayer:
         bestUCT = -math.inf
 
         for child in node.children:
-            childScore = child.UCT()
+            if self.puct is not None:
+                childScore = child.PUCT(self.puct)
+            elif self.rave is not None:
+                childScore = child.RAVE(self.rave, child.lastMove[0] * state.size + child.lastMove[1])
+            else:
+                childScore = child.UCT()
             if childScore > bestUCT:
                 bestChildNode = child
                 bestUCT = childScore
-                
-        return self.findSpotToExpand(bestChildNode)
 
-    def rollout(self, node): # Algoritme (23) uit de reader.
+        state.push(bestChildNode.lastMove)
+        return self.findSpotToExpand(bestChildNode, state)
+
+    def bestPrior(self, state, untried):
         """
-        Performs a roll-out from the given node to the end of the game and determines the winner.
-        
-        Time-Complexity O(n): This is because the dominant factor in the time complexity of rollout is the generation and shuffling of the list of valid moves, 
-        both of which have a time complexity of O(n) where n is the number of valid moves. 
+        The untried move with the highest gomoku_patterns priority for the player to move, and its prior: its share of the
+        priorities of all candidate moves (every move counts at least 1, so no prior is 0).
+
+        Time-Complexity O(n): one table lookup per candidate move.
         """
-        state = deepcopy(node.state)
-        valid_moves = deepcopy(gomoku.valid_moves(node.state))
-        random.shuffle(valid_moves)
+        patterns = state.patterns
+        colour   = 2 if state.ply % 2 else 1
+        size     = state.size
+        values   = {move: patterns.priority(move[0] * size + move[1], colour) + 1 for move in state.candidate_moves()}
+        action   = max(untried, key=values.__getitem__)
+        return action, values[action] / sum(values.values())
 
-        while not node.isTerminal() and len(valid_moves) != 0:
-            action = valid_moves.pop()
-            _, _, state = gomoku.move(state, action)
+    def bestAMAF(self, node, state, untried):
+        """
+        The untried move with the best AMAF value in node (moves without AMAF statistics count as 0, ties are broken at random).
+
+        Time-Complexity O(n): the AMAF values of the n untried moves are looked up in one vectorised step.
+        """
+        size   = state.size
+        cells  = np.array([row * size + col for row, col in untried], dtype=np.intp)
+        values = node.amafQ[cells] / (node.amafN[cells] + 1)
+        return untried[random.choice(np.flatnonzero(values == values.max()))]
 
-        return self.whoWon(node, state)
+    def rollout(self, node, state): # Algoritme (23) uit de reader.
+        """
+        Performs a roll-out from the given node to the end of the game and determines the winner.
+        The state must be positioned at node. A terminal node is not played out: its lastMove won (for the player that is not to move) or the board is full.
+        Otherwise gomoku_rollout stops the roll-out at the first winning stone.
+        With rolloutBatch > 1 the sum of the results of that many roll-outs is returned.
+        
+        Time-Complexity O(n): This is because the dominant factor in the time complexity of rollout is playing and taking back at most the n valid moves, 
+        every single push, win check along the lines of the stone and pop takes O(1). A batch does the same for all its roll-outs in one vectorised step per ply. 
+        """
+        self.playout = []
+        if node.isTerminal():
+            result = (gomoku_rollout.LOSS if node.win else gomoku_rollout.DRAW) * self.rolloutBatch
+        elif self.rolloutBatch > 1:
+            result = int(gomoku_rollout.rollout_batch(state, self.rolloutBatch).sum())
+        else:
+            result = gomoku_rollout.rollout(state, moves=self.playout if self.rave is not None else None)
+        return self.whoWon(result, node.ply)
 
-    def BackupValue(self, val, node): # Algoritme (24) uit de reader.
+    def BackupValue(self, val, node, visits=1): # Algoritme (24) uit de reader.
         """
-        Updates the statistics of all nodes along the path from the expanded node to the root with the outcome of the roll-out.
+        Updates the statistics of all nodes along the path from the expanded node to the root with the outcome of the roll-out
+        (or with the summed outcome of a batch of visits roll-outs).
         
-        Time-Complexity O(1): This is because it is just based on a single node.
+        Time-Complexity O(1): This is because it is just based on a single node. (With rave: O(d * m), see BackupAMAF.)
         """
+        if self.rave is not None:
+            self.BackupAMAF(val, node, visits)
         while node is not None:
-            node.N += 1
-            if node.state[1] % 2 == self.black:
+            node.N += visits
+            if node.ply % 2 == self.black:
                 node.Q -= val
             else:
                 node.Q += val
 
             node = node.parent
 
+    def BackupAMAF(self, val, node, visits=1):
+        """
+        Updates the AMAF statistics of the nodes from the root to node: every node counts the moves that the player to move
+        there played later on in this iteration (in the tree and in the roll-out), as if they had been played first.
+
+        Time-Complexity O(d * m): d nodes on the path, each with a vectorised update of at most m moves.
+        """
+        path = []
+        while node is not None:
+            path.append(node)
+            node = node.parent
+        path.reverse()
+        size  = self.search.size
+        moves = [child.lastMove for child in path[1:]] + self.playout
+        cells = np.array([row * size + col for row, col in moves], dtype=np.intp)
+        for i, node in enumerate(path):
+            if node.amafN is None:
+                node.amafN = np.zeros(size * size, dtype=np.int32)
+                node.amafQ = np.zeros(size * size, dtype=np.float32)
+            own = cells[i::2] # the moves of the player to move at node, which are scored like the children of node
+            node.amafN[own] += visits
+            node.amafQ[own] += -val if (node.ply + 1) % 2 == self.black else val
+
+    def startTimer(self, max_time_to_move):
+        """Starts the MoveTimer of a move, calibrated with the iterations of the previous move."""
+        return MoveTimer(max_time_to_move, self.iterationNs, maxIterations=self.maxIterations)
+
+    def stopTimer(self, timer):
+        """
+        Stores the report of the move's MoveTimer and the iteration cost for the calibration of the next move. The cost is averaged
+        with that of the earlier moves, with halving weights, so one slow iteration (e.g. a garbage collection) is forgotten after a few moves.
+        """
+        if timer.slowestNs:
+            self.iterationNs = (self.iterationNs + timer.slowestNs) // 2 if self.iterationNs else timer.slowestNs
+        self.budgetReport = timer.report()
+
+    def forcedMove(self, state, timer):
+        """
+        Looks for a move that needs no search: a move of the opening book (basePlayer.bookMove), or a forced win or forced loss
+        to block, found by gomoku_threats. When one is found the move is final: the tree of the previous move is dropped and the timer is stopped.
+        :return: the forced move, or None when the position has to be searched
+        """
+        found = self.bookMove(state)
+        if found is None and self.tacticsMs:
+            tactic = gomoku_threats.forced_move(self.engine.SearchState(state, patterns=True), min(self.tacticsMs, timer.budgetNs / 1e7), self.tacticsThrees)
+            found  = tactic[0] if tactic is not None else None
+        if found is None:
+            return None
+        self.root = None
+        self.stopTimer(timer)
+        return found
+
+    def searchTree(self, state, last_move, timer):
+        """
+        Runs MCTS iterations from the given position until the timer runs out.
+        :return: the SearchState (positioned at the root again) and the root node of the searched tree
+
+        Time-Complexity O(i * n): i iterations of which each takes O(n) time.
+        """
+        search, n_root = self.reuseTree(state, last_move) # search is the only board of the search, walked down and up the tree
+        
+        while timer.tick():
+            n_leaf = self.findSpotToExpand(n_root, search)
+            val    = self.rollout(n_leaf, search)
+            self.BackupValue(val, n_leaf, self.rolloutBatch)
+            for _ in range(n_leaf.ply - n_root.ply): # back up to the root position
+                search.pop()
+        return search, n_root
+
     def move(self, state: GameState, last_move: Move, max_time_to_move: int = 1000) -> Move: #Algoritme (21) uit de reader.
         """This is the most important method: the agent will get:
         1) the current state of the game
         2) the last move by the opponent
         3) the available moves you can play (this is a special service we provide ;-) )
         4) the maximum time until the agent is required to make a move in milliseconds [diverging from this will lead to disqualification].
+        The search runs until the deadline of the MoveTimer, self.budgetReport tells how much of the budget was used.
+        A forced win or a forced loss to block (see forcedMove) is played without searching.
         """
-        n_root = GameTreeNode(deepcopy(state), lastMove=last_move)
-        
-        while max_time_to_move != 0:
-            n_leaf = self.findSpotToExpand(n_root)
-            val    = self.rollout(n_leaf)
-            self.BackupValue(val, n_leaf)
-            max_time_to_move -= 1
+        timer = self.startTimer(max_time_to_move)
+        forced = self.forcedMove(state, timer)
+        if forced is not None:
+            return forced
+        search, n_root = self.searchTree(state, last_move, timer)
 
         bestMove = None
+        bestChild = None
         bestVal = -math.inf
 
         for child in n_root.children:
             childVal = child.Q / child.N
-            if childVal > bestVal and child.lastMove in gomoku.valid_moves(deepcopy(state)):
+            if childVal > bestVal and child.lastMove in search.valid_moves():
                 bestVal = childVal
                 bestMove = child.lastMove
+                bestChild = child
 
-        return bestMove
+        # keep the subtree of our move for the next call, see reuseTree
+        self.root = bestChild
+        if bestChild is not None:
+            search.push(bestMove)
+        self.stopTimer(timer)
+        return bestMove if bestMove is not None else self.fallbackMove(search)
+
+    def fallbackMove(self, search):
+        """A random candidate move, for when not a single iteration fitted in the budget (the search never returns no move)."""
+        return random.choice(list(search.candidate_moves()))
 
     def id(self) -> str:
         """Please return a string here that uniquely identifies your submission e.g., "name (student_id)" """
-        return "Ahmet Serdar Çanak (1760039)"
\ No newline at end of file
+        return "Ahmet Serdar Çanak (1760039)"
+
+
+class ahmetTTPlayer(ahmetPlayer):
+    """
+    ahmetPlayer with a transposition-aware search: the statistics live in a TranspositionTable keyed by the Zobrist hash
+    of the SearchState, so the tree becomes a DAG in which identical positions share their N and Q.
+    maxEntries bounds the number of stored positions (least recently used ones are evicted).
+    """
+    def __init__(self, black_: bool = True, bitboard_: bool = False, maxEntries: int = 200000, maxIterations: int = None, radius: int = None, tacticsMs: float = 30,
+                 book: str = None, bookPlies: int = 8):
+        super().__init__(black_, bitboard_, maxIterations, radius=radius, tacticsMs=tacticsMs, book=book, bookPlies=bookPlies)
+        self.maxEntries = maxEntries
+        self.table      = None # kept between the moves of a game: positions searched before are found again through their hash
+
+    def new_game(self, black_: bool):
+        super().new_game(black_)
+        self.table = None
+
+    def childKey(self, state, move):
+        """
+        The hash of the position after playing move on state, without playing it.
+
+        Time-Complexity O(1): two XOR's with precomputed Zobrist keys.
+        """
+        colour = 2 if state.ply % 2 else 1
+        return state.hash ^ state.keys[colour][move[0] * state.size + move[1]] ^ state.side_key
+
+    def expand(self, entry, state, action, path):
+        """Plays action on state and stores the (new) entry of the resulting position, which is returned."""
+        _, win = state.push(action)
+        child = TTEntry(state, action, win)
+        self.table.add(state.hash, child)
+        path.append(child)
+        return child
+
+    def findSpotToExpand(self, entry, state, path): # Algoritme (22) uit de reader, op een DAG.
+        """
+        Chooses an entry to expand, like ahmetPlayer.findSpotToExpand. Every entry that is visited is appended to path,
+        which BackupValue then updates. An untried move that leads to a position in the table continues from its entry,
+        a child that was evicted from the table is expanded again.
+
+        Time-Complexity O(n): collecting the untried moves or scoring the expanded children both take O(n) time.
+        """
+        if entry.isTerminal():
+            return entry
+
+        if not entry.isFullyExpanded():
+            tried  = set(entry.moves)
+            action = random.choice([move for move in state.candidate_moves() if move not in tried])
+            entry.moves.append(action)
+            child  = self.table.get(self.childKey(state, action))
+            if child is None:
+                return self.expand(entry, state, action, path)
+            state.push(action) # a transposition: the position was reached before through other moves, its statistics are kept
+            path.append(child)
+            return self.findSpotToExpand(child, state, path)
+
+        bestMove  = None
+        bestChild = None
+        bestUCT   = -math.inf
+        logN      = math.log(entry.N)
+
+        for move in entry.moves:
+            child = self.table.get(self.childKey(state, move))
+            if child is None: # evicted: this position has to be expanded once more
+                return self.expand(entry, state, move, path)
+            childScore = (child.Q / child.N) + (1 / math.sqrt(2)) * math.sqrt(2 * logN / child.N)
+            if childScore > bestUCT:
+                bestMove  = move
+                bestChild = child
+                bestUCT   = childScore
+
+        state.push(bestMove)
+        path.append(bestChild)
+        return self.findSpotToExpand(bestChild, state, path)
+
+    def BackupValue(self, val, path): # Algoritme (24) uit de reader.
+        """
+        Updates the statistics of the entries on the path that was actually walked (a DAG has no unique parent to follow).
+
+        Time-Complexity O(d): d is the length of the path.
+        """
+        for entry in path:
+            entry.N += 1
+            if entry.ply % 2 == self.black:
+                entry.Q -= val
+            else:
+                entry.Q += val
+
+    def move(self, state: GameState, last_move: Move, max_time_to_move: int = 1000) -> Move:
+        """See ahmetPlayer.move. The transposition table of the previous moves is reused, so the statistics of positions that
+        were already searched (typically the ones after our previous move and the opponent's reply) are kept."""
+        timer  = self.startTimer(max_time_to_move)
+        forced = self.forcedMove(state, timer)
+        if forced is not None:
+            return forced
+        search = self.engine.SearchState(state, self.radius)
+        if self.table is None:
+            self.table = TranspositionTable(self.maxEntries)
+        root = self.table.get(search.hash)
+        if root is None:
+            root = TTEntry(search, last_move)
+            self.table.add(search.hash, root)
+        self.reused = root.N
+
+        while timer.tick():
+            path = [root]
+            leaf = self.findSpotToExpand(root, search, path)
+            val  = self.rollout(leaf, search)
+            self.BackupValue(val, path)
+            for _ in range(len(path) - 1): # back up to the root position
+                search.pop()
+
+        bestMove = None
+        bestVal  = -math.inf
+
+        for move in root.moves:
+            child = self.table.get(self.childKey(search, move))
+            if child is not None and child.Q / child.N > bestVal:
+                bestVal  = child.Q / child.N
+                bestMove = move
+
+        self.stopTimer(timer)
+        return bestMove if bestMove is not None else self.fallbackMove(search)
+
+
+
+class TreeStore:
+    """
+    Struct-of-arrays storage of a search tree: node i is described by entry i of every array, instead of by a GameTreeNode object.
+    The children of a node form a linked list (firstChild / nextSibling), -1 means "none". Moves are flat cell indices (row * size + col).
+    No positions are stored: they are reconstructed by pushing the moves along the path on a gomoku.SearchState.
+    The arrays are preallocated and doubled in size when they are full.
+    """
+    FIELDS = (("parent", np.int32), ("move", np.int16), ("ply", np.int16), ("nValid", np.int16), ("nChildren", np.int16),
+              ("firstChild", np.int32), ("nextSibling", np.int32), ("win", np.bool_), ("N", np.int32), ("Q", np.float32))
+
+    def __init__(self, capacity: int = 4096):
+        self.size = 0
+        for name, dtype in TreeStore.FIELDS:
+            setattr(self, name, np.empty(capacity, dtype=dtype))
+
+    def grow(self):
+        """Doubles the capacity of all arrays. Time-Complexity O(n), but amortised O(1) per added node."""
+        for name, _ in TreeStore.FIELDS:
+            old = getattr(self, name)
+            new = np.empty(2 * len(old), dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def addNode(self, parent, move, ply, nValid, win):
+        """
+        Adds a node (as first child of parent, unless parent is -1) and returns its index.
+
+        Time-Complexity O(1) amortised: a handful of array writes.
+        """
+        if self.size == len(self.parent):
+            self.grow()
+        node = self.size
+        self.size += 1
+        self.parent[node]     = parent
+        self.move[node]       = move
+        self.ply[node]        = ply
+        self.nValid[node]     = nValid
+        self.nChildren[node]  = 0
+        self.firstChild[node] = -1
+        self.win[node]        = win
+        self.N[node]          = 0
+        self.Q[node]          = 0
+        if parent >= 0:
+            self.nextSibling[node]  = self.firstChild[parent]
+            self.firstChild[parent] = node
+            self.nChildren[parent] += 1
+        else:
+            self.nextSibling[node] = -1
+        return node
+
+    def children(self, node):
+        """
+        The indices of the children of node.
+
+        Time-Complexity O(c): walks the sibling list of the c children.
+        """
+        result = []
+        child = int(self.firstChild[node])
+        while child >= 0:
+            result.append(child)
+            child = int(self.nextSibling[child])
+        return result
+
+    def bytesPerNode(self):
+        """The number of bytes used per stored node."""
+        return sum(np.dtype(dtype).itemsize for _, dtype in TreeStore.FIELDS)
+
+    def __len__(self):
+        return self.size
+
+
+class ahmetArrayPlayer(ahmetPlayer):
+    """
+    ahmetPlayer on a TreeStore instead of GameTreeNode objects: same algorithm, but the UCT of all children is computed in one
+    vectorised expression, the backup is a single indexed update and a node takes a few dozen bytes.
+    """
+    def __init__(self, black_: bool = True, bitboard_: bool = False, capacity: int = 4096, maxIterations: int = None, radius: int = None, tacticsMs: float = 30,
+                 book: str = None, bookPlies: int = 8):
+        super().__init__(black_, bitboard_, maxIterations, radius=radius, tacticsMs=tacticsMs, book=book, bookPlies=bookPlies)
+        self.capacity = capacity
+        self.tree     = None
+
+    def isTerminal(self, node):
+        """Time-Complexity O(1): the win flag and number of valid moves are stored in the tree."""
+        return self.tree.win[node] or self.tree.nValid[node] == 0
+
+    def findSpotToExpand(self, node, state, path): # Algoritme (22) uit de reader.
+        """
+        Chooses a node to expand, like ahmetPlayer.findSpotToExpand. The nodes on the way are appended to path
+        and their moves are pushed on state.
+
+        Time-Complexity O(n): collecting the untried moves or scoring the children both take O(n) time.
+        """
+        tree = self.tree
+        while not self.isTerminal(node):
+            children = tree.children(node)
+            if tree.nChildren[node] < tree.nValid[node]:
+                tried  = {int(move) for move in tree.move[children]}
+                size   = state.size
+                action = random.choice([move for move in state.candidate_moves() if move[0] * size + move[1] not in tried])
+                _, win = state.push(action)
+                child  = tree.addNode(node, action[0] * size + action[1], state.ply, len(state.candidate_moves()), win)
+                path.append(child)
+                return child
+
+            children = np.array(children)
+            N = tree.N[children]
+            uct = tree.Q[children] / N + (1 / math.sqrt(2)) * np.sqrt(2 * math.log(tree.N[node]) / N)
+            node = int(children[np.argmax(uct)])
+            state.push(divmod(int(tree.move[node]), state.size))
+            path.append(node)
+        return node
+
+    def rollout(self, node, state): # Algoritme (23) uit de reader.
+        """
+        See ahmetPlayer.rollout, on a node of the TreeStore.
+
+        Time-Complexity O(n): playing and taking back at most the n valid moves.
+        """
+        if self.isTerminal(node):
+            result = gomoku_rollout.LOSS if self.tree.win[node] else gomoku_rollout.DRAW
+        else:
+            result = gomoku_rollout.rollout(state)
+        return self.whoWon(result, int(self.tree.ply[node]))
+
+    def BackupValue(self, val, path): # Algoritme (24) uit de reader.
+        """
+        Updates the statistics of the nodes on path in one go.
+
+        Time-Complexity O(d): d is the length of the path, but the work is done by two vectorised updates.
+        """
+        path = np.array(path)
+        self.tree.N[path] += 1
+        self.tree.Q[path] += np.where(self.tree.ply[path] % 2 == self.black, -val, val)
+
+    def move(self, state: GameState, last_move: Move, max_time_to_move: int = 1000) -> Move:
+        """See ahmetPlayer.move, the search tree is a fresh TreeStore."""
+        timer         = self.startTimer(max_time_to_move)
+        forced        = self.forcedMove(state, timer)
+        if forced is not None:
+            return forced
+        search        = self.engine.SearchState(state, self.radius)
+        self.size     = search.size
+        self.tree     = TreeStore(self.capacity)
+        root          = self.tree.addNode(-1, -1, search.ply, len(search.candidate_moves()), search.check_win(last_move))
+
+        while timer.tick():
+            path = [root]
+            leaf = self.findSpotToExpand(root, search, path)
+            val  = self.rollout(leaf, search)
+            self.BackupValue(val, path)
+            for _ in range(len(path) - 1): # back up to the root position
+                search.pop()
+
+        self.stopTimer(timer)
+        children = self.tree.children(root)
+        if not children:
+            return self.fallbackMove(search)
+        children = np.array(children)
+        best = children[np.argmax(self.tree.Q[children] / self.tree.N[children])]
+        return divmod(int(self.tree.move[best]), self.size)
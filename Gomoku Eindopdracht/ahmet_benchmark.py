@@ -0,0 +1,292 @@
+# Benchmarks for the variants of ahmetPlayer.
+# Run this file to compare them; every benchmark prints a small table.
+
+import gc, os, random, time, tracemalloc
+import gomoku, gomoku_bitboard, gomoku_rollout, gomoku_threats
+from gomoku_solver import Solver, solverPlayer
+from ahmet_agent import ahmetPlayer, ahmetTTPlayer, ahmetArrayPlayer
+from ahmet_parallel import ahmetParallelPlayer
+
+
+def midgame_state(bsize=19, nofStones=20, seed=0):
+    """A reproducible position with nofStones randomly placed stones (near the centre) and no five in a row yet."""
+    rng = random.Random(seed)
+    while True:
+        state = gomoku.starting_state(bsize)
+        won = False
+        for _ in range(nofStones):
+            middle = bsize // 2
+            moves = [m for m in gomoku.valid_moves(state) if abs(m[0] - middle) <= 4 and abs(m[1] - middle) <= 4]
+            _, won, state = gomoku.move(state, rng.choice(moves or gomoku.valid_moves(state)))
+            if won:
+                break
+        if not won:
+            return state
+
+
+def visits_per_second(player, state, max_time_to_move):
+    """Lets player search state once (max_time_to_move ms) and returns the number of iterations per second of wall time."""
+    player.new_game(state[1] % 2 == 1)
+    player.tacticsMs = 0  # always search, also when the position has a forced move
+    start = time.perf_counter()
+    player.move((state[0].copy(), state[1]), (), max_time_to_move)
+    return player.budgetReport["iterations"] / (time.perf_counter() - start)
+
+
+def play_match(player1, player2, nofGames=10, bsize=9, max_time_to_move=1000):
+    """
+    Plays nofGames games between player1 and player2 (max_time_to_move ms per move), swapping colours every game.
+    :return: the score of player1 (1 for a win, 0.5 for a draw) and the number of games
+    """
+    score = 0.0
+    for game in range(nofGames):
+        black, white = (player1, player2) if game % 2 == 0 else (player2, player1)
+        black.new_game(True)
+        white.new_game(False)
+        state = gomoku.starting_state(bsize)
+        last_move = ()
+        while True:
+            current = black if state[1] % 2 == 1 else white
+            last_move = current.move((state[0].copy(), state[1]), last_move, max_time_to_move)
+            ok, win, state = gomoku.move(state, last_move)
+            if not ok:  # an illegal move loses the game
+                score += current is not player1
+                break
+            if win:
+                score += current is player1
+                break
+            if len(gomoku.valid_moves(state)) == 0:
+                score += 0.5
+                break
+    return score, nofGames
+
+
+def benchmark_tt(bsize=19, max_time_to_move=2000, nofGames=10, matchSize=9, match_time=300):
+    """Compares the plain tree with the transposition table search: visits per second, table use and playing strength."""
+    state = midgame_state(bsize)
+    random.seed(0)
+    tree = visits_per_second(ahmetPlayer(), state, max_time_to_move)
+    random.seed(0)
+    ttPlayer = ahmetTTPlayer()
+    dag = visits_per_second(ttPlayer, state, max_time_to_move)
+    table = ttPlayer.table
+    print("visits/s  tree: %8.0f   dag: %8.0f" % (tree, dag))
+    print("dag table: %d entries, %d hits, %d misses, %d evictions" % (len(table), table.hits, table.misses, table.evictions))
+    score, games = play_match(ahmetTTPlayer(), ahmetPlayer(), nofGames, matchSize, match_time)
+    print("dag vs tree on %dx%d: %.1f / %d" % (matchSize, matchSize, score, games))
+
+
+def tree_memory(player, state, iterations):
+    """
+    Lets player search state for a fixed number of iterations and returns the number of nodes of its tree and the number of
+    bytes the tree still holds after the search (tracemalloc), so the temporary allocations of the roll-outs don't count.
+    For ahmetArrayPlayer that includes the unused capacity of the TreeStore arrays.
+    """
+    player.new_game(state[1] % 2 == 1)
+    player.tacticsMs     = 0
+    player.maxIterations = iterations
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    if isinstance(player, ahmetArrayPlayer):
+        player.move((state[0].copy(), state[1]), (), 10**9)  # the fixed number of iterations ends the search, not the time
+        nodes = player.tree.size
+    else:
+        _, root = player.searchTree((state[0].copy(), state[1]), (), player.startTimer(10**9))
+        player.search = None  # only the tree is measured
+        nodes, todo = 0, [root]
+        while todo:
+            node = todo.pop()
+            nodes += 1
+            todo.extend(node.children)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return nodes, held
+
+
+def benchmark_tree_store(bsize=19, max_time_to_move=2000, iterations=20000):
+    """
+    Compares GameTreeNode objects with the TreeStore arrays: nodes per second, and the bytes per node that a tree of a fixed
+    number of iterations holds after the search (for the arrays also the bytes per node of the filled part only).
+    """
+    state = midgame_state(bsize)
+    for name, make in (("objects", ahmetPlayer), ("arrays", ahmetArrayPlayer)):
+        random.seed(0)
+        speed = visits_per_second(make(), state, max_time_to_move)
+        random.seed(0)
+        player = make()
+        nodes, held = tree_memory(player, state, iterations)
+        line = "%-8s nodes/s: %8.0f   nodes: %6d   bytes/node: %6.0f   nodes/GB: %10.0f" % (name, speed, nodes, held / nodes, 2**30 * nodes / held)
+        if isinstance(player, ahmetArrayPlayer):
+            line += "   (filled part: %d bytes/node)" % player.tree.bytesPerNode()
+        print(line)
+
+
+def full_board_rollout(state):
+    """The roll-out ahmetPlayer used before gomoku_rollout: fill the whole board, then look at the last stone only."""
+    played = 0
+    while len(state.valid_moves()) != 0:
+        state.push(random.choice(state.valid_moves()))
+        played += 1
+    result = gomoku_rollout.DRAW
+    if state.check_win(state.last_move()):
+        result = gomoku_rollout.WIN if played % 2 == 1 else gomoku_rollout.LOSS
+    for _ in range(played):
+        state.pop()
+    return result
+
+
+def benchmark_rollouts(bsize=19, nofRollouts=512):
+    """Roll-outs per second and the share of decided (non-draw) results of the old, the early-terminating and the batched roll-outs."""
+    state = gomoku.SearchState(midgame_state(bsize))
+    for name, play in (("full board", full_board_rollout), ("early stop", gomoku_rollout.rollout)):
+        random.seed(0)
+        start = time.perf_counter()
+        results = [play(state) for _ in range(nofRollouts)]
+        speed = nofRollouts / (time.perf_counter() - start)
+        decided = sum(result != gomoku_rollout.DRAW for result in results) / nofRollouts
+        print("%-10s rollouts/s: %8.0f   decided: %4.0f%%" % (name, speed, 100 * decided))
+    for K in (16, 64, 256):
+        random.seed(0)
+        start = time.perf_counter()
+        results = [result for _ in range(max(nofRollouts // K, 1)) for result in gomoku_rollout.rollout_batch(state, K)]
+        speed = len(results) / (time.perf_counter() - start)
+        decided = sum(result != gomoku_rollout.DRAW for result in results) / len(results)
+        print("%-10s rollouts/s: %8.0f   decided: %4.0f%%" % ("batch %d" % K, speed, 100 * decided))
+
+
+def benchmark_engines(bsize=19, nofPushes=4000, nofRollouts=256, max_time_to_move=2000):
+    """The numpy and the bitboard SearchState: microseconds per push + check_win + pop, roll-outs per second and ahmetPlayer's visits per second."""
+    position = midgame_state(bsize)
+    for name, engine in (("numpy", gomoku), ("bitboard", gomoku_bitboard)):
+        state = engine.SearchState(position)
+        moves = list(state.valid_moves())
+        start = time.perf_counter()
+        for k in range(nofPushes):
+            state.push(moves[k % len(moves)])
+            state.pop()
+        pushUs = (time.perf_counter() - start) / nofPushes * 1e6
+        random.seed(0)
+        start = time.perf_counter()
+        for _ in range(nofRollouts):
+            gomoku_rollout.rollout(state)
+        speed = nofRollouts / (time.perf_counter() - start)
+        visits = visits_per_second(ahmetPlayer(bitboard_=engine is gomoku_bitboard), position, max_time_to_move)
+        print("%-8s push/pop: %5.1f us   rollouts/s: %6.0f   visits/s: %6.0f" % (name, pushUs, speed, visits))
+
+
+def benchmark_candidates(bsize=19, max_time_to_move=1000, radii=(None, 1, 2, 3), nofGames=6, matchSize=13, match_time=300):
+    """
+    The effect of the candidate radius: root branching factor, the share of the root's children that got expanded,
+    roll-outs per second and the match score against the unrestricted player.
+    """
+    state = midgame_state(bsize)
+    for radius in radii:
+        random.seed(0)
+        player = ahmetPlayer(state[1] % 2 == 1, radius=radius)
+        start  = time.perf_counter()
+        search, root = player.searchTree((state[0].copy(), state[1]), (), player.startTimer(max_time_to_move))
+        speed  = root.N / (time.perf_counter() - start)
+        random.seed(0)
+        start = time.perf_counter()
+        for _ in range(200):
+            gomoku_rollout.rollout(search)
+        rollouts = 200 / (time.perf_counter() - start)
+        line = "radius: %4s   branching: %3d   expanded: %4.0f%%   visits/s: %6.0f   rollouts/s: %6.0f" % (
+            radius, root.nValid, 100 * len(root.children) / root.nValid, speed, rollouts)
+        if radius is not None:
+            score, games = play_match(ahmetPlayer(radius=radius), ahmetPlayer(), nofGames, matchSize, match_time)
+            line += "   vs all moves on %dx%d: %.1f / %d" % (matchSize, matchSize, score, games)
+        print(line)
+
+
+def benchmark_tactics(bsize=19, nofPositions=50, max_time_ms=30, nofGames=6, matchSize=9, match_time=300):
+    """How often and how fast gomoku_threats finds a forced move in midgame positions, and the match score of ahmetPlayer with and without it."""
+    for threes in (False, True):
+        found = slowest = total = 0
+        for seed in range(nofPositions):
+            state = gomoku.SearchState(midgame_state(bsize, 30, seed))
+            start = time.perf_counter()
+            found += gomoku_threats.forced_move(state, max_time_ms, threes) is not None
+            used = time.perf_counter() - start
+            total += used
+            slowest = max(slowest, used)
+        print("threes: %-5s   forced: %3d / %d   mean: %5.1f ms   slowest: %5.1f ms"
+              % (threes, found, nofPositions, 1000 * total / nofPositions, 1000 * slowest))
+    score, games = play_match(ahmetPlayer(), ahmetPlayer(tacticsMs=0), nofGames, matchSize, match_time)
+    print("with vs without tactics on %dx%d: %.1f / %d" % (matchSize, matchSize, score, games))
+
+
+def benchmark_patterns(bsize=19, nofPushes=2000, puct=1.0, nofGames=8, matchSize=13, match_time=300, radius=2):
+    """The cost of keeping the gomoku_patterns scores up to date per stone, and the match score of PUCT with pattern priors against UCT."""
+    for patterns in (False, True):
+        state = gomoku.SearchState(midgame_state(bsize), patterns=patterns)
+        moves = list(state.valid_moves())
+        start = time.perf_counter()
+        for i in range(nofPushes):
+            state.push(moves[i % len(moves)])
+            state.pop()
+        print("patterns: %-5s   push + pop: %5.1f us" % (patterns, 1e6 * (time.perf_counter() - start) / nofPushes))
+    score, games = play_match(ahmetPlayer(puct=puct, radius=radius), ahmetPlayer(radius=radius), nofGames, matchSize, match_time)
+    print("puct %.1f vs uct on %dx%d (radius %s): %.1f / %d" % (puct, matchSize, matchSize, radius, score, games))
+
+
+def benchmark_rave(bsize=19, max_time_to_move=1000, k=30, nofGames=16, matchSize=9, match_time=300):
+    """Visits per second with and without RAVE, and the match score of RAVE against plain UCT at the same time per move."""
+    state = midgame_state(bsize)
+    for rave in (None, k):
+        random.seed(0)
+        print("rave: %4s   visits/s: %6.0f" % (rave, visits_per_second(ahmetPlayer(rave=rave), state, max_time_to_move)))
+    score, games = play_match(ahmetPlayer(rave=k), ahmetPlayer(), nofGames, matchSize, match_time)
+    print("rave (k=%d) vs uct on %dx%d: %.1f / %d" % (k, matchSize, matchSize, score, games))
+
+
+def benchmark_solver(sizes=((5, 12), (7, 16), (7, 24)), nofPositions=12, max_time_ms=1000, nofGames=6, matchSize=7, match_time=300):
+    """How many midgame positions (board size, stones) the exact solver proves within max_time_ms, and its match score against ahmetPlayer."""
+    for bsize, stones in sizes:
+        proven = nodes = used = 0
+        for seed in range(nofPositions):
+            found = Solver().solve(midgame_state(bsize, stones, seed), max_time_ms)
+            proven += found.result is not None
+            nodes += found.nodes
+            used += found.timeMs
+        print("%dx%d, %2d stones   proven: %3d / %d   nodes/s: %6.0f" % (bsize, bsize, stones, proven, nofPositions, 1000 * nodes / used))
+    score, games = play_match(solverPlayer(), ahmetPlayer(), nofGames, matchSize, match_time)
+    print("solver vs ahmetPlayer on %dx%d: %.1f / %d" % (matchSize, matchSize, score, games))
+
+
+def benchmark_root_parallel(bsize=19, max_time_to_move=1000, nofMoves=3):
+    """The scaling curve of root parallelisation: simulations per move for 1, 2, 4, ... workers up to the number of cores."""
+    state = midgame_state(bsize)
+    workers = [1]
+    while workers[-1] * 2 <= os.cpu_count():
+        workers.append(workers[-1] * 2)
+    if workers[-1] != os.cpu_count():
+        workers.append(os.cpu_count())
+    single = None
+    for nofWorkers in workers:
+        player = ahmetParallelPlayer(nofWorkers=nofWorkers, tacticsMs=0)
+        player.new_game(state[1] % 2 == 1)  # starts the pool
+        simulations = used = dispatch = 0
+        for _ in range(nofMoves):
+            player.move((state[0].copy(), state[1]), (), max_time_to_move)
+            simulations += player.budgetReport["iterations"] / nofMoves
+            dispatch += player.budgetReport["dispatchMs"] / nofMoves
+            used = max(used, player.budgetReport["usedMs"])
+        player.close()
+        single = single or simulations
+        print("workers: %3d   simulations/move: %8.0f   speedup: %5.2f   slowest move: %6.1f ms   dispatch: %5.1f ms"
+              % (nofWorkers, simulations, simulations / single, used, dispatch))
+
+
+if __name__ == "__main__":
+    benchmark_rollouts()
+    benchmark_engines()
+    benchmark_tt()
+    benchmark_tree_store()
+    benchmark_candidates()
+    benchmark_tactics()
+    benchmark_patterns()
+    benchmark_rave()
+    benchmark_solver()
+    benchmark_root_parallel()
@@ -0,0 +1,148 @@
+# Root-parallel MCTS for ahmetPlayer.
+# Every worker process searches the same position with its own random stream; the visit counts (N) and
+# scores (Q) of the root's children are summed over the workers before the move is chosen.
+# The workers are started once (at new_game or the first move) and reused for every move. The position is
+# handed over through a multiprocessing.shared_memory int8 buffer, so only a few numbers are pickled per move.
+# NB: on platforms that start processes with "spawn" (Windows, macOS) the script that creates the
+# player must protect its main code with  if __name__ == "__main__":
+
+import math, multiprocessing, os, random, time
+import numpy as np
+from multiprocessing import shared_memory
+from gomoku import Move, GameState
+from ahmet_agent import ahmetPlayer
+
+_sharedMemory = None # the shared board buffer, as attached by this worker process
+_player       = None # the ahmetPlayer of this worker process, kept between moves so it can reuse its tree
+
+
+def attachWorker(name):
+    """Initialiser of a worker process: attaches the shared board buffer once."""
+    global _sharedMemory, _player
+    _sharedMemory = shared_memory.SharedMemory(name=name)
+    _player       = ahmetPlayer()
+
+
+def searchRoot(task):
+    """
+    The work of one worker: an ordinary ahmetPlayer search of the position in the shared buffer until the (wall-clock) deadline.
+    :param task: (board size, ply, last_move, black, deadline in time.time_ns(), random seed, bitboard, candidate radius)
+    :return: {move: (N, Q)} of the children of the root, the number of iterations and the start and end time of the search
+    """
+    global _player
+    startNs = time.time_ns()
+    bsize, ply, last_move, black, deadlineNs, seed, bitboard, radius = task
+    board = np.ndarray((bsize, bsize), dtype=np.int8, buffer=_sharedMemory.buf) # SearchState copies it
+    random.seed(seed)
+    if _player.black != black or _player.bitboard != bitboard or _player.radius != radius:
+        _player = ahmetPlayer(black, bitboard, radius=radius)
+    timer = _player.startTimer((deadlineNs - startNs) / 1000000)
+    search, root = _player.searchTree((board, ply), last_move, timer)
+    children = {child.lastMove: (child.N, child.Q) for child in root.children}
+    # keep the subtree of this worker's own best move, ahmetPlayer.reuseTree checks whether the position matches next time
+    _player.root = max(root.children, key=lambda child: child.Q / child.N, default=None)
+    if _player.root is not None:
+        search.push(_player.root.lastMove)
+    return children, timer.iterations, startNs, time.time_ns()
+
+
+class ahmetParallelPlayer(ahmetPlayer):
+    """
+    ahmetPlayer that searches the root position in nofWorkers processes at the same time (root parallelisation).
+    The pool of workers and the shared board buffer are created once, at new_game (or at the first move), and kept until close()
+    (or until the player is garbage collected).
+    reserveMs of the move's budget is kept free for the dispatch to the workers and merging their results;
+    when the previous move needed more than that, the reserve grows with it.
+    """
+    startsProcesses = True # so a parallel Competition, whose daemonic workers can't start the pool, refuses the player
+
+    def __init__(self, black_: bool = True, bitboard_: bool = False, nofWorkers: int = None, reserveMs: float = 30, maxBoardSize: int = 19, radius: int = None,
+                 tacticsMs: float = 30, book: str = None, bookPlies: int = 8):
+        super().__init__(black_, bitboard_, radius=radius, tacticsMs=tacticsMs, book=book, bookPlies=bookPlies)
+        self.nofWorkers   = nofWorkers or os.cpu_count()
+        self.reserveMs    = reserveMs
+        self.overheadNs   = 0    # the time of the previous move that was not spent searching in the workers
+        self.maxBoardSize = maxBoardSize
+        self.pool         = None
+        self.shared       = None
+
+    def startPool(self, bsize):
+        """Starts the worker processes and the shared board buffer (for boards up to maxBoardSize), if that wasn't done yet."""
+        if self.pool is not None and bsize <= self.maxBoardSize:
+            return
+        self.close()
+        self.maxBoardSize = max(self.maxBoardSize, bsize)
+        self.shared = shared_memory.SharedMemory(create=True, size=self.maxBoardSize * self.maxBoardSize)
+        try:
+            self.pool = multiprocessing.Pool(self.nofWorkers, initializer=attachWorker, initargs=(self.shared.name,))
+        except BaseException: # e.g. inside a daemonic process, which may not start children: the buffer must not leak
+            self.close()
+            raise
+
+    def new_game(self, black_: bool):
+        super().new_game(black_)
+        self.startPool(self.maxBoardSize)
+
+    def merge(self, results):
+        """
+        Sums the (N, Q) of every root child over the results of the workers.
+
+        Time-Complexity O(w * c): w workers with c root children each.
+        """
+        merged = {}
+        for children, _, _, _ in results:
+            for move, (N, Q) in children.items():
+                total = merged.get(move, (0, 0))
+                merged[move] = (total[0] + N, total[1] + Q)
+        return merged
+
+    def move(self, state: GameState, last_move: Move, max_time_to_move: int = 1000) -> Move:
+        """See ahmetPlayer.move; every worker searches until the same deadline. self.budgetReport also reports the dispatch overhead.
+        A forced move (ahmetPlayer.forcedMove) is found in this process, without waking the workers."""
+        start  = time.time_ns()
+        forced = self.forcedMove(state, self.startTimer(max_time_to_move))
+        if forced is not None:
+            return forced
+        bsize = len(state[0])
+        self.startPool(bsize)
+        reserveNs = max(self.reserveMs * 1000000, 1.5 * self.overheadNs)
+        deadline  = start + int(max_time_to_move * 1000000 - reserveNs)
+        np.ndarray((bsize, bsize), dtype=np.int8, buffer=self.shared.buf)[:] = state[0]
+        last_move = tuple(int(x) for x in last_move) if last_move else ()
+        tasks     = [(bsize, state[1], last_move, self.black, deadline, random.getrandbits(64), self.bitboard, self.radius)
+                     for _ in range(self.nofWorkers)]
+        results   = self.pool.map(searchRoot, tasks, chunksize=1)
+        searched  = time.time_ns()
+
+        merged   = self.merge(results)
+        bestMove = None
+        bestVal  = -math.inf
+        for move, (N, Q) in merged.items():
+            if Q / N > bestVal:
+                bestVal  = Q / N
+                bestMove = move
+
+        stop = time.time_ns()
+        # dispatch: until the last worker started searching, plus from the last worker's end until the results were merged
+        dispatchNs = max(r[2] for r in results) - start + stop - max(r[3] for r in results)
+        self.overheadNs   = max(searched - deadline, 0) + (stop - searched)
+        self.budgetReport = {"usedMs": (stop - start) / 1e6, "budgetMs": max_time_to_move, "usedFraction": (stop - start) / (max_time_to_move * 1e6),
+                             "iterations": sum(r[1] for r in results), "workers": self.nofWorkers, "dispatchMs": dispatchNs / 1e6}
+        return bestMove if bestMove is not None else self.fallbackMove(self.engine.SearchState(state, self.radius))
+
+    def close(self):
+        """Stops the worker processes, releases the shared board buffer and closes the opening book."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        if self.shared is not None:
+            self.shared.close()
+            self.shared.unlink()
+            self.shared = None
+        super().close()
+
+    def __del__(self):
+        """A player that is discarded without close() still stops its workers and releases the shared board buffer."""
+        if getattr(self, "pool", None) is not None or getattr(self, "shared", None) is not None:
+            self.close()
@@ -1,5 +1,6 @@
 import random
 from gomoku import Move, GameState
+from gomoku_book import OpeningBook
 from GmUtils import GmUtils
 
 # This default base player does a randomn move
@@ -10,9 +11,14 @@ class basePlayer:
     your player
     """
 
-    def __init__(self, black_: bool = True):
-        """Constructor for the player."""
+    def __init__(self, black_: bool = True, book_: str = None, bookPlies_: int = 8):
+        """Constructor for the player.
+        book_ is the path of an opening book (see gomoku_book), which is consulted for the first bookPlies_ plies.
+        The book is opened at its first lookup, so a player that is pickled (e.g. to a competition worker) holds no open file."""
         self.black = black_
+        self.bookPath = book_
+        self.book = None
+        self.bookPlies = bookPlies_
 
     def new_game(self, black_: bool):
         """At the start of each new game you will be notified by the competition.
@@ -30,9 +36,33 @@ class basePlayer:
         3) the available moves you can play (this is a special service we provide ;-) )
         4) the maximum time until the agent is required to make a move in milliseconds [diverging from this will lead to disqualification].
         """
-        moves = GmUtils.getValidMoves(state[0])
+        opening = self.bookMove(state)
+        if opening is not None:
+            return opening
+        moves = GmUtils.getValidMoves(state[0], state[1])
         return random.choice(moves)
 
+    def bookMove(self, state: GameState) -> Move:
+        """The move of the opening book for this position, or None (no book, past bookPlies_ or an unknown position).
+        Subclasses call this at the start of their move method."""
+        if self.bookPath is None:
+            return None
+        if self.book is None:
+            self.book = OpeningBook(self.bookPath)
+        return self.book.move(state, self.bookPlies)
+
+    def close(self):
+        """Closes the opening book (it is opened again when it is needed)."""
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+
+    def __getstate__(self):
+        """Pickles the player without its open opening book."""
+        state = self.__dict__.copy()
+        state["book"] = None
+        return state
+
     def id(self) -> str:
         """Please return a string here that uniquely identifies your submission e.g., "name (student_id)" """
         return "random_player"
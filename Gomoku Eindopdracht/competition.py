@@ -1,105 +1,337 @@
 # NB: python version 3.7 or higher is required (else time_ns()) doesn't work
 
 import gomoku
+import gomoku_bitboard
+import gomoku_gamelog
 from random_agent import random_dummy_player
 from gomoku_ai_marius1_webclient import gomoku_ai_marius1_webclient
 from gomoku_ai_random_webclient import gomoku_ai_random_webclient
+import json
+import math
+import multiprocessing
+import os
 import random
 import time
 
 
+def physical_cores():
+    """The number of physical cores (psutil knows them; without psutil every logical core counts)."""
+    try:
+        import psutil
+
+        return psutil.cpu_count(logical=False) or os.cpu_count()
+    except ImportError:
+        return os.cpu_count()
+
+
+_worker = None  # the Competition of this worker process, with its own players
+
+
+def _start_worker(bsize, bitboard, factories):
+    """Initialiser of a worker process of the parallel competition: creates the players of this process.
+    factories holds per player its factory, or None and the (unpickled copy of the) player itself."""
+    global _worker
+    _worker = Competition(bsize, bitboard)
+    _worker.players = [
+        factory() if factory is not None else player for factory, player in factories
+    ]
+
+
+def _play_pairing(task):
+    """The work of a worker process: one game of the competition. Returns its gomoku_gamelog record."""
+    i, j, maxtime_per_move, tolerance, round_ = task
+    return _worker.play_game(i, j, maxtime_per_move, tolerance, round_=round_)
+
+
+class LatencyHistogram:
+    """Move times (ms) in a histogram with logarithmic buckets of 2% each, so the percentiles are within 2% whatever the
+    number of moves, plus the exact maximum, the ply of the slowest move and the number of moves that took longer than the budget."""
+
+    RATIO = 1.02
+    MINIMUM = 0.001  # ms; shorter times are counted in the first bucket
+
+    def __init__(self):
+        self.buckets = {}  # bucket number -> count
+        self.count = 0
+        self.max = 0.0
+        self.worst_ply = None
+        self.over_budget = 0
+
+    def add(self, ms, ply=None, budget_ms=None):
+        """Time-Complexity O(1)."""
+        bucket = max(0, int(math.log(max(ms, self.MINIMUM) / self.MINIMUM, self.RATIO)))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        if ms >= self.max:
+            self.max = ms
+            self.worst_ply = ply
+        if budget_ms is not None and ms > budget_ms:
+            self.over_budget += 1
+
+    def percentile(self, p):
+        """The upper bound of the bucket that holds the p-th percentile (0 < p <= 100), at most the maximum; 0 without times."""
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.MINIMUM * self.RATIO ** (bucket + 1), self.max)
+        return 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "worst_ply": self.worst_ply,
+            "over_budget": self.over_budget,
+        }
+
+
 class Competition:
     """This class runs the competition between the submitted players.
     A player needs to have the new_game(black) and move(board, prev_move, valid_moves_list)
     methods implemented. Players are registered one by one using the register_player method.
     The competition is started using the play_competition method."""
 
-    def __init__(self, bsize_=19):
-        """Initialises the competition. The board size (default 19) for the entire competition can be set here."""
+    def __init__(self, bsize_=19, bitboard_=False):
+        """Initialises the competition. The board size (default 19) for the entire competition can be set here.
+        With bitboard_=True the games are refereed by the gomoku_bitboard engine; the players still
+        receive a numpy board, just like with the default engine."""
         self.players = []
+        self.factories = []  # per player: how the worker processes of a parallel competition create it, see register_player
         self.results = []
+        self.latencies = []  # per player: LatencyHistogram's of its move times and of the engine's move function
         self.bsize = bsize_
+        self.bitboard = bitboard_
+        self.engine = gomoku_bitboard if bitboard_ else gomoku
 
-    def register_player(self, player_):
+    def register_player(self, player_, factory_=None):
         """This method registers an AI player that the students have implemented.
-        This player needs to be in a separate file."""
+        This player needs to be in a separate file.
+        factory_ is a picklable callable without arguments that creates a new, equal player (e.g. the class, or a
+        functools.partial of it); the parallel competition creates the players of every worker process with it.
+        Without a factory the workers get a (pickled) copy of player_."""
         self.players.append(player_)
+        self.factories.append(factory_)
 
-    def play_competition(self, maxtime_per_move=1000, tolerance=0.05):
-        """This method runs the actual competition between the registered players.
-        Each player plays each other player twice: once with black and once with white."""
-        self.results = []
+    def play_game(self, i, j, maxtime_per_move=1000, tolerance=0.05, players=None, round_=0):
+        """Plays one game between player i (black) and player j (white).
+        players are the player objects to use (by default self.players).
+        Returns the gomoku_gamelog record of the game: the moves, their times (ms), the time the engine needed to
+        play them (ms) and the points of i and of j.
+        An illegal move is not in the moves but in record["illegal"], as (ply, move, time)."""
+        players = players or self.players
         mtime = (
             maxtime_per_move * (1.0 + tolerance) * 1000000
         )  # operational maxtime in nanoseconds
+        points = {i: 0.0, j: 0.0}
+        record = gomoku_gamelog.game_record(
+            round_, i, j, players[i].id(), players[j].id(), self.bsize
+        )
+        players[i].new_game(True)  # player i is black
+        players[j].new_game(False)  # player j is white
+        game = self.engine.starting_state(bsize_=self.bsize)  # initialise the game
+        previous_move = ()
+        over = False
+        while not over:
+            if game[1] % 2 == 1:  # black to move
+                current_player = players[i]
+                pid = i
+                pid_other = j
+            else:  # white to move
+                current_player = players[j]
+                pid = j
+                pid_other = i
+            random.seed(
+                time.time_ns()
+            )  # just in case the other player has tinkered with random.seed.
+            start_time = time.time_ns()
+            move = current_player.move(
+                gomoku_bitboard.to_numpy_state(game) if self.bitboard else game,
+                previous_move,
+                max_time_to_move=maxtime_per_move,
+            )
+            stop_time = time.time_ns()
+            # print(str((stop_time-start_time)/1000000)+"/"+str(maxtime_per_move*(1+tolerance)))
+            ok, win, game = self.engine.move(
+                game, move
+            )  # perform the move, and obtain whether the move was valid (ok) and whether the move results in a win
+            engine_time = time.time_ns()
+            previous_move = move
+            if ok:
+                record["moves"].append(int(move[0]) * self.bsize + int(move[1]))
+                record["times"].append(round((stop_time - start_time) / 1000000, 2))
+                record["engine_times"].append(round((engine_time - stop_time) / 1000000, 3))
+            else:
+                record.setdefault("illegal", []).append(
+                    (game[1], [int(x) for x in move], round((stop_time - start_time) / 1000000, 2))
+                )
+            # Uncomment the follwing two lines if you want to watch the games unfold slowly:
+            # time.sleep(1)
+            # gomoku.pretty_board(game[0])
+            if (stop_time - start_time) > mtime:
+                # player who made the illegal move should be disqualified. This needs to be done manually.
+                print(
+                    "disqualified for exceeding maximum time per move: player "
+                    + str(pid)
+                )
+            if not ok:
+                # player who made the illegal move should be disqualified. This needs to be done manually.
+                print("disqualified for illegal move: player " + str(pid))
+                print("on board: ")
+                self.engine.pretty_board(game[0])
+                print(
+                    "trying to play: ("
+                    + str(move[0])
+                    + ","
+                    + str(move[1])
+                    + ")"
+                )
+                if game[1] % 2 == 1:
+                    print("as black")
+                else:
+                    print("as white")
+            if win:
+                over = True
+                points[pid] += 1
+            elif len(self.engine.valid_moves(game)) == 0:
+                # if there are no more valid moves, the board is full and it's a draw
+                over = True
+                points[pid] += 0.5
+                points[pid_other] += 0.5
+        record["points"] = [points[i], points[j]]
+        return record
+
+    def play_competition(self, maxtime_per_move=1000, tolerance=0.05, parallel=False, games_per_core=1.0, log_path=None, round_=None):
+        """This method runs the actual competition between the registered players.
+        Each player plays each other player twice: once with black and once with white.
+        With parallel=True the games are played at the same time in a pool of worker processes, at most games_per_core
+        games per physical core (more than one lets the players share a core, which costs them thinking time).
+        NB: the script that runs a parallel competition must protect its main code with  if __name__ == "__main__":
+        The worker processes are daemonic and can't start processes of their own, so a parallel competition raises a
+        ValueError for players that do (startsProcesses, e.g. ahmetParallelPlayer); play those with parallel=False.
+        With a log_path every finished game is appended to that gomoku_gamelog file, as a game of round round_. By default
+        that is the round after the last one in the log, so every call plays new games. The games of a given round_ that
+        are already in the log (same players, same board size) are not played again: their points are taken from the log,
+        so a competition that crashed can be resumed by passing the number of its round.
+        Returns the round that was played."""
+        if parallel:
+            spawning = [type(player).__name__ for player in self.players if getattr(player, "startsProcesses", False)]
+            if spawning:
+                raise ValueError(
+                    "players that start their own processes can't play in a parallel competition: %s"
+                    % ", ".join(spawning)
+                )
+        self.new_results(maxtime_per_move)
+        if round_ is None:
+            round_ = gomoku_gamelog.next_round(log_path) if log_path is not None else 0
+        pairings = [
+            (i, j)
+            for i in range(len(self.players))
+            for j in range(len(self.players))
+            if i != j  # players do not play themselves
+        ]
+        log = None
+        if log_path is not None:
+            keys = {
+                (round_, i, j, self.players[i].id(), self.players[j].id()): (i, j)
+                for i, j in pairings
+            }
+            for record in gomoku_gamelog.read_games(log_path):
+                key = gomoku_gamelog.pairing(record)
+                if key in keys and record["bsize"] == self.bsize:
+                    self.add_result(record)
+                    pairings.remove(keys.pop(key))
+            log = gomoku_gamelog.GameLog(log_path)
+        try:
+            if not parallel:
+                for i, j in pairings:
+                    self.add_result(
+                        self.play_game(i, j, maxtime_per_move, tolerance, round_=round_), log
+                    )
+                return round_
+            factories = [
+                (factory, player if factory is None else None)
+                for player, factory in zip(self.players, self.factories)
+            ]
+            processes = max(1, min(len(pairings), int(physical_cores() * games_per_core)))
+            with multiprocessing.Pool(
+                processes,
+                initializer=_start_worker,
+                initargs=(self.bsize, self.bitboard, factories),
+            ) as pool:
+                tasks = [(i, j, maxtime_per_move, tolerance, round_) for i, j in pairings]
+                for record in pool.imap_unordered(_play_pairing, tasks):
+                    self.add_result(record, log)
+            return round_
+        finally:
+            if log is not None:
+                log.close()
+
+    def new_results(self, maxtime_per_move=1000):
+        """Sets the results matrix to all zeroes and starts new latency histograms (for a budget of maxtime_per_move ms)."""
+        self.results = []
+        self.budget_ms = maxtime_per_move
+        self.latencies = [
+            {"move": LatencyHistogram(), "engine": LatencyHistogram()}
+            for _ in self.players
+        ]
         for i in range(len(self.players)):
             self.results.append(
                 [0.0] * len(self.players)
             )  # set the results matrix to all zeroes
-        for i in range(len(self.players)):
-            for j in range(len(self.players)):
-                if i == j:
-                    continue  # players do not play themselves
-                self.players[i].new_game(True)  # player i is black
-                self.players[j].new_game(False)  # player j is white
-                game = gomoku.starting_state(bsize_=self.bsize)  # initialise the game
-                previous_move = ()
-                over = False
-                while not over:
-                    if game[1] % 2 == 1:  # black to move
-                        current_player = self.players[i]
-                        pid = i
-                        pid_other = j
-                    else:  # white to move
-                        current_player = self.players[j]
-                        pid = j
-                        pid_other = i
-                    random.seed(
-                        time.time_ns()
-                    )  # just in case the other player has tinkered with random.seed.
-                    start_time = time.time_ns()
-                    move = current_player.move(
-                        game, previous_move, max_time_to_move=maxtime_per_move
-                    )
-                    stop_time = time.time_ns()
-                    # print(str((stop_time-start_time)/1000000)+"/"+str(maxtime_per_move*(1+tolerance)))
-                    ok, win, game = gomoku.move(
-                        game, move
-                    )  # perform the move, and obtain whether the move was valid (ok) and whether the move results in a win
-                    previous_move = move
-                    # Uncomment the follwing two lines if you want to watch the games unfold slowly:
-                    # time.sleep(1)
-                    # gomoku.pretty_board(game[0])
-                    if (stop_time - start_time) > mtime:
-                        # player who made the illegal move should be disqualified. This needs to be done manually.
-                        print(
-                            "disqualified for exceeding maximum time per move: player "
-                            + str(pid)
-                        )
-                    if not ok:
-                        # player who made the illegal move should be disqualified. This needs to be done manually.
-                        print("disqualified for illegal move: player " + str(pid))
-                        print("on board: ")
-                        gomoku.pretty_board(game[0])
-                        print(
-                            "trying to play: ("
-                            + str(move[0])
-                            + ","
-                            + str(move[1])
-                            + ")"
-                        )
-                        if game[1] % 2 == 1:
-                            print("as black")
-                        else:
-                            print("as white")
-                    if win:
-                        over = True
-                        self.results[pid][pid_other] += 1
-                    elif len(gomoku.valid_moves(game)) == 0:
-                        # if there are no more valid moves, the board is full and it's a draw
-                        over = True
-                        self.results[pid][pid_other] += 0.5
-                        self.results[pid_other][pid] += 0.5
+
+    def add_result(self, record, log=None):
+        """Adds the points of a game record to the results matrix and its move times to the latencies
+        (and appends the record to the log)."""
+        i, j = record["black"], record["white"]
+        self.results[i][j] += record["points"][0]
+        self.results[j][i] += record["points"][1]
+        players = (i, j)
+        for k, ms in enumerate(record["times"]):  # moves[k] was made at ply k + 1, by black when k is even
+            self.latencies[players[k % 2]]["move"].add(ms, k + 1, self.budget_ms)
+        for k, ms in enumerate(record.get("engine_times", ())):
+            self.latencies[players[k % 2]]["engine"].add(ms, k + 1)
+        for ply, _, ms in record.get("illegal", ()):
+            self.latencies[players[(ply - 1) % 2]]["move"].add(ms, ply, self.budget_ms)
+        if log is not None:
+            log.write(record)
+
+    def latency_report(self):
+        """The latencies of the last competition per player, as a machine-readable list of dictionaries (see LatencyHistogram.summary)."""
+        return [
+            {
+                "player": i,
+                "id": player.id(),
+                "budget_ms": self.budget_ms,
+                "move": self.latencies[i]["move"].summary(),
+                "engine": self.latencies[i]["engine"].summary(),
+            }
+            for i, player in enumerate(self.players)
+        ]
+
+    def export_latencies(self, path):
+        """Writes latency_report() to a JSON file."""
+        with open(path, "w", encoding="utf-8") as out:
+            json.dump(self.latency_report(), out, indent=1)
+
+    def print_latencies(self):
+        """This method prints how long every player thought per move (in ms) and how close it came to the time per move."""
+        print(
+            "%-3s %-30s %6s %8s %8s %8s %8s %6s %6s %10s %10s"
+            % ("", "player", "moves", "p50", "p90", "p99", "max", "over", "ply", "engine p50", "engine p99")
+        )
+        for report in self.latency_report():
+            move, engine = report["move"], report["engine"]
+            print(
+                "%-3d %-30s %6d %8.1f %8.1f %8.1f %8.1f %6d %6s %10.3f %10.3f"
+                % (report["player"], report["id"][:30], move["count"], move["p50"], move["p90"], move["p99"],
+                   move["max"], move["over_budget"], move["worst_ply"], engine["p50"], engine["p99"])
+            )
+        print("(over: moves longer than %s ms; ply: the ply of the slowest move; engine: the time of the engine's move function)" % self.budget_ms)
 
     def print_scores(self):
         """This method prints the results of the competition to sysout"""
@@ -114,17 +346,19 @@ class Competition:
 # Now follows the main script for running the competition
 # At present the competition consists of just three random dummy players playing each other
 # When the students submit a player file, they should be entered one by one.
-game = gomoku.starting_state()
+if __name__ == "__main__":
+    game = gomoku.starting_state()
 
-player0 = random_dummy_player()
-player1 = gomoku_ai_marius1_webclient()
-player2 = gomoku_ai_random_webclient()
+    player0 = random_dummy_player()
+    player1 = gomoku_ai_marius1_webclient()
+    player2 = gomoku_ai_random_webclient()
 
-comp = Competition()
-comp.register_player(player1)
-comp.register_player(player2)
+    comp = Competition()
+    comp.register_player(player1)
+    comp.register_player(player2)
 
-nofCompetitions = 1
-for i in range(nofCompetitions):
-    comp.play_competition()
-    comp.print_scores()
+    nofCompetitions = 1
+    for i in range(nofCompetitions):
+        comp.play_competition()
+        comp.print_scores()
+        comp.print_latencies()
@@ -3,7 +3,11 @@
 
 import numpy as np
 import itertools
-from typing import Tuple, List
+import copy
+from array import array
+from functools import lru_cache
+from typing import Tuple, List, Sequence
+from gomoku_patterns import PatternScores
 
 # Simple Data Types to define the game with
 Board = np.array  # two-dimensional (typically 19 by 19)
@@ -11,18 +15,135 @@ GameState = Tuple[Board, int]  # The board plus the ply number.
 # For example, ply==1 means: the first move on the current board still needs to be done.
 # Player "black" alias "X" alias value 1 is allowed to make the first move.
 
+HashedGameState = Tuple[Board, int, int]  # A GameState that also carries its Zobrist hash.
+
 Move = Tuple[int, int]  # location on the board: (row, col)
 # NB: Don't worry about the warnings; nested types are still very buggy in Python type checking
 
 SIZE = 7
 
 
-def starting_state(bsize_: int = SIZE) -> GameState:
+@lru_cache(maxsize=None)
+def zobrist_keys(bsize: int) -> Tuple[np.ndarray, List[List[int]], int]:
+    """
+    The random 64-bit Zobrist keys for a board size. They are drawn from a generator seeded with the
+    board size, so hashes are the same in every run and process (which opening books and caches need).
+    :return: the keys as a (3, bsize * bsize) uint64 array indexed by [colour][row * bsize + col]
+    (row 0, the "empty colour", is all zeroes), the same keys as nested lists of python ints
+    (much faster for a single lookup) and the key that is XOR-ed in when white (an even ply) is to move
+    """
+    rng = np.random.default_rng(bsize)
+    table = rng.integers(0, 2**64, size=(3, bsize * bsize), dtype=np.uint64, endpoint=False)
+    table[0] = 0
+    side = int(rng.integers(0, 2**64, dtype=np.uint64, endpoint=False))
+    return table, table.tolist(), side
+
+
+def zobrist_hash(board: Board, ply: int) -> int:
+    """
+    Computes the Zobrist hash of a position from scratch: the XOR of the keys of all stones,
+    plus the side key when the ply is even.
+    Time-Complexity O(n) for n cells; use the incrementally updated hash where possible.
+    """
+    bsize = np.shape(board)[0]
+    table, _, side = zobrist_keys(bsize)
+    flat = np.asarray(board, dtype=np.intp).ravel()
+    h = int(np.bitwise_xor.reduce(table[flat, np.arange(bsize * bsize)]))
+    return h ^ side if ply % 2 == 0 else h
+
+
+# The 8 symmetries of the square board (the dihedral group D4), numbered 0 .. 7: symmetry t turns the board t % 4 quarter turns
+# (numpy.rot90), after first transposing it when t >= 4. Symmetric positions are the same position for search and books, and
+# the smallest of their 8 Zobrist hashes is a key that is shared by all of them.
+NOF_SYMMETRIES = 8
+
+
+@lru_cache(maxsize=None)
+def symmetries(bsize: int) -> np.ndarray:
+    """
+    The symmetries as cell permutations: a (8, bsize * bsize) array whose [t][cell] is the flat index (row * bsize + col)
+    that the flat index cell goes to under symmetry t. Row 0 is the identity.
+    """
+    cells = np.arange(bsize * bsize).reshape(bsize, bsize)
+    perms = np.empty((NOF_SYMMETRIES, bsize * bsize), dtype=np.intp)
+    for t in range(NOF_SYMMETRIES):
+        image = np.rot90(cells.T if t >= 4 else cells, t % 4)
+        perms[t][image.ravel()] = np.arange(bsize * bsize)  # the cell that lands on flat index i of the image is image[i]
+    return perms
+
+
+@lru_cache(maxsize=None)
+def inverse_symmetries(bsize: int) -> np.ndarray:
+    """The inverse permutations of symmetries(bsize): [t][cell] is the flat index that goes to cell under symmetry t."""
+    perms = symmetries(bsize)
+    inverse = np.empty_like(perms)
+    inverse[np.arange(NOF_SYMMETRIES)[:, None], perms] = np.arange(bsize * bsize)
+    return inverse
+
+
+@lru_cache(maxsize=None)
+def symmetry_keys(bsize: int) -> np.ndarray:
+    """
+    The Zobrist keys per symmetry: a (8, 3, bsize * bsize) uint64 array whose [t][colour][cell] is the key of a stone of colour
+    on cell after symmetry t. XOR-ing [:, colour, cell] into a vector of 8 hashes updates the hashes of all symmetric versions
+    of a position at once, without building any rotated board.
+    """
+    table, _, _ = zobrist_keys(bsize)
+    return np.ascontiguousarray(table[:, symmetries(bsize)].transpose(1, 0, 2))
+
+
+def symmetric_hashes(board: Board, ply: int) -> np.ndarray:
+    """
+    The Zobrist hashes of the 8 symmetric versions of a position, as a uint64 array indexed by symmetry (entry 0 equals
+    zobrist_hash(board, ply)).
+    Time-Complexity O(s) for s stones, in one vectorised pass.
+    """
+    bsize = np.shape(board)[0]
+    flat = np.asarray(board, dtype=np.intp).ravel()
+    stones = np.flatnonzero(flat)
+    hashes = np.bitwise_xor.reduce(symmetry_keys(bsize)[:, flat[stones], stones], axis=1) if len(stones) else np.zeros(NOF_SYMMETRIES, dtype=np.uint64)
+    return hashes ^ np.uint64(zobrist_keys(bsize)[2]) if ply % 2 == 0 else hashes
+
+
+def canonical_hash(board: Board, ply: int) -> Tuple[int, int]:
+    """
+    The canonical key of a position: the smallest Zobrist hash over its 8 symmetric versions, and the symmetry t that gives it.
+    transform_board(board, t) is the canonical form of the board and transform_move(move, t, bsize) maps a move onto it.
+    """
+    hashes = symmetric_hashes(board, ply)
+    t = int(np.argmin(hashes))
+    return int(hashes[t]), t
+
+
+def transform_board(board: Board, t: int) -> Board:
+    """The board after symmetry t (a new array)."""
+    bsize = np.shape(board)[0]
+    flat = np.asarray(board).ravel()
+    image = np.empty_like(flat)
+    image[symmetries(bsize)[t]] = flat
+    return image.reshape(bsize, bsize)
+
+
+def transform_move(move: Move, t: int, bsize: int) -> Move:
+    """Where move goes under symmetry t."""
+    return divmod(int(symmetries(bsize)[t][move[0] * bsize + move[1]]), bsize)
+
+
+def inverse_move(move: Move, t: int, bsize: int) -> Move:
+    """The move that goes to move under symmetry t: maps a move on the transformed board back onto the original board."""
+    return divmod(int(inverse_symmetries(bsize)[t][move[0] * bsize + move[1]]), bsize)
+
+
+def starting_state(bsize_: int = SIZE, hashed_: bool = False) -> GameState:
     """
     Creates a new game (start state of the game) as a square 2-dimensional numpy array of bytes (int8)
     :param bsize_: the size of the board
+    :param hashed_: whether the state should carry a Zobrist hash as third element,
+    move() keeps it up to date incrementally
     :return: a new empty board, on the first ply (half-move) to make
     """
+    if hashed_:
+        return np.zeros((bsize_, bsize_), dtype=np.int8), 1, 0
     return np.zeros((bsize_, bsize_), dtype=np.int8), 1
 
 
@@ -33,6 +154,8 @@ def valid_moves(state: GameState) -> List[Move]:
     :param state: the state of the game
     :return: a list of valid moves (tuples of 2 integers indicating locations on the board)
     """
+    if isinstance(state, SearchState):
+        return state.valid_moves()
     board = state[0]
     ply = state[1]
     if ply == 1:
@@ -143,10 +266,58 @@ def check_win(board: Board, last_move: Move) -> bool:
     return False
 
 
+_LINE_DIRECTIONS = np.array([(0, 1), (1, 0), (1, 1), (1, -1)])
+
+
+def check_win_batch(boards: np.ndarray, last_moves: np.ndarray, series: int = 5) -> np.ndarray:
+    """
+    Vectorised check_win for many boards at once, e.g. for rollouts that advance in lock-step.
+    The same rule holds: the last move wins when it lines up /exactly/ `series` stones
+    (GmGameRules.winningSeries, 5 for gomoku) horizontally, vertically or diagonally.
+    :param boards: an (N, size, size) int8 array of boards
+    :param last_moves: an (N, 2) integer array with the (row, col) of the last move on each board,
+    a row with a negative coordinate means "no last move" (the () or None of check_win)
+    :param series: the exact number of stones in a row that wins
+    :return: a boolean array of length N
+    """
+    boards = np.asarray(boards)
+    last_moves = np.asarray(last_moves, dtype=np.intp).reshape(-1, 2)
+    played = (last_moves >= 0).all(axis=1)
+    rows = np.where(played, last_moves[:, 0], 0)
+    cols = np.where(played, last_moves[:, 1], 0)
+    # the boards get a border of `series` empty cells, so every line through a last move
+    # can be read as 2 * series + 1 cells without bounds checks.
+    padded = np.pad(boards, ((0, 0), (series, series), (series, series)))
+    return played & check_win_padded(padded, np.arange(len(boards)), rows, cols, series)
+
+
+def check_win_padded(padded: np.ndarray, which: np.ndarray, rows: np.ndarray, cols: np.ndarray, series: int = 5) -> np.ndarray:
+    """
+    The work of check_win_batch, on boards that already have a border of `series` empty cells
+    (so code that plays many plies on the same boards only pads them once).
+    :param padded: an (N, size + 2 * series, size + 2 * series) array of padded boards
+    :param which: the indices of the boards to check
+    :param rows: the row of the last move on each checked board (in unpadded coordinates)
+    :param cols: the column of the last move on each checked board (in unpadded coordinates)
+    :return: a boolean array with a result per checked board
+    """
+    offsets = np.arange(-series, series + 1)
+    line_rows = rows[:, None, None] + series + _LINE_DIRECTIONS[None, :, 0, None] * offsets
+    line_cols = cols[:, None, None] + series + _LINE_DIRECTIONS[None, :, 1, None] * offsets
+    lines = padded[which[:, None, None], line_rows, line_cols]  # (len(which), 4, 2 * series + 1)
+    colour = lines[:, 0, series]
+    same = lines == colour[:, None, None]
+    # the number of equal stones directly after / before the last move on each line
+    forward = np.cumprod(same[:, :, series + 1 :], axis=2).sum(axis=2)
+    backward = np.cumprod(same[:, :, series - 1 :: -1], axis=2).sum(axis=2)
+    exact = (1 + forward + backward) == series
+    return (colour != 0) & exact.any(axis=1)
+
+
 def move(state: GameState, move: Move) -> Tuple[bool, bool, GameState]:
     """
     A function to get to a new state when playing a move
-    :param state: the current state of the game
+    :param state: the current state of the game, if it carries a Zobrist hash the new state does too
     :param move: a move (tuple indicating location of stone to place)
     :return: whether the move was valid, whether the move wins the game, and the new game state
     """
@@ -164,11 +335,273 @@ def move(state: GameState, move: Move) -> Tuple[bool, bool, GameState]:
         board[move[0]][
             move[1]
         ] = colour  # for ply>3 it is always allowed to place a stone as long as the square is empty
+        if len(state) > 2:
+            _, keys, side = zobrist_keys(np.shape(board)[0])
+            h = state[2] ^ keys[colour][move[0] * np.shape(board)[0] + move[1]] ^ side
+            return True, check_win(board, move), (board, ply + 1, h)
         return True, check_win(board, move), (board, ply + 1)
     else:
         return False, False, state
 
 
+@lru_cache(maxsize=None)
+def _cell_moves(bsize: int) -> Tuple[Move, ...]:
+    """The move tuple for every flat cell index (row * bsize + col), so they don't need to be rebuilt."""
+    return tuple(itertools.product(range(bsize), range(bsize)))
+
+
+@lru_cache(maxsize=None)
+def _neighbourhood(bsize: int, radius: int) -> Tuple[Tuple[int, ...], ...]:
+    """The flat indices of the cells within Chebyshev distance radius of every flat cell index (the cell itself excluded)."""
+    return tuple(
+        tuple(
+            r * bsize + c
+            for r in range(max(row - radius, 0), min(row + radius + 1, bsize))
+            for c in range(max(col - radius, 0), min(col + radius + 1, bsize))
+            if (r, c) != (row, col)
+        )
+        for row, col in _cell_moves(bsize)
+    )
+
+
+class EmptyCells(Sequence):
+    """
+    Index of the empty cells of a board, kept up to date move by move instead of rescanning the board.
+    The flat indices of the empty cells are the first `count` entries of `cells` (a swap-remove array),
+    and `pos` maps every flat index to its place in `cells`. Both are compact int16 arrays.
+    The index itself is a read-only sequence of moves, so it can be handed out as valid_moves.
+    """
+
+    __slots__ = ("size", "moves", "cells", "pos", "count")
+
+    def __init__(self, board: Board, members: np.ndarray = None):
+        """:param members: a flat boolean mask of the cells in the index, by default the empty cells of board"""
+        bsize = self.size = np.shape(board)[0]
+        if members is None:
+            members = np.asarray(board).ravel() == 0
+        empty = np.flatnonzero(members)
+        taken = np.flatnonzero(~members)
+        self.moves = _cell_moves(bsize)
+        self.cells = array("h", itertools.chain(empty.tolist(), taken.tolist()))
+        self.pos = array("h", bytes(2 * bsize * bsize))
+        for i, cell in enumerate(self.cells):
+            self.pos[cell] = i
+        self.count = len(empty)
+
+    def remove(self, cell: int):
+        """Marks the flat cell index as taken. Time-Complexity O(1)."""
+        i = self.pos[cell]
+        last = self.cells[self.count - 1]
+        self.cells[i] = last
+        self.pos[last] = i
+        self.cells[self.count - 1] = cell
+        self.pos[cell] = self.count - 1
+        self.count -= 1
+
+    def add(self, cell: int):
+        """Marks the (taken) flat cell index as empty again. Time-Complexity O(1)."""
+        i = self.pos[cell]
+        first = self.cells[self.count]
+        self.cells[i] = first
+        self.pos[first] = i
+        self.cells[self.count] = cell
+        self.pos[cell] = self.count
+        self.count += 1
+
+    def copy(self) -> "EmptyCells":
+        clone = copy.copy(self)
+        clone.cells = array("h", self.cells)
+        clone.pos = array("h", self.pos)
+        return clone
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> Move:
+        if not -self.count <= i < self.count:
+            raise IndexError("EmptyCells index out of range")
+        return self.moves[self.cells[i % self.count]]
+
+    def __iter__(self):
+        moves, cells = self.moves, self.cells
+        for i in range(self.count):
+            yield moves[cells[i]]
+
+    def __contains__(self, move) -> bool:
+        if not (0 <= move[0] < self.size and 0 <= move[1] < self.size):
+            return False
+        return self.pos[move[0] * self.size + move[1]] < self.count
+
+
+class CandidateCells(EmptyCells):
+    """
+    Index of the empty cells within Chebyshev distance `radius` of a stone: the moves that are worth searching on a big board.
+    `near` counts the stones around every cell, so placing or taking back a stone only updates the (2 * radius + 1) ** 2 cells
+    around it instead of rescanning the board.
+    """
+
+    __slots__ = ("radius", "near", "stones", "neighbours")
+
+    def __init__(self, board: Board, radius: int = 2):
+        board = np.asarray(board)
+        bsize = np.shape(board)[0]
+        stones = board != 0
+        padded = np.pad(stones, radius).astype(np.int16)
+        span = 2 * radius + 1
+        near = sum(padded[dr : dr + bsize, dc : dc + bsize] for dr in range(span) for dc in range(span)) - stones
+        super().__init__(board, ((near > 0) & ~stones).ravel())
+        self.radius = radius
+        self.near = array("h", near.ravel().tolist())
+        self.stones = bytearray(stones.ravel().tolist())
+        self.neighbours = _neighbourhood(bsize, radius)
+
+    def place(self, cell: int):
+        """A stone was placed on the flat cell index. Time-Complexity O(radius^2)."""
+        if self.pos[cell] < self.count:
+            self.remove(cell)
+        self.stones[cell] = 1
+        near, stones = self.near, self.stones
+        for other in self.neighbours[cell]:
+            near[other] += 1
+            if near[other] == 1 and not stones[other]:
+                self.add(other)
+
+    def take_back(self, cell: int):
+        """The stone on the flat cell index was taken back. Time-Complexity O(radius^2)."""
+        self.stones[cell] = 0
+        near, pos = self.near, self.pos
+        for other in self.neighbours[cell]:
+            near[other] -= 1
+            if near[other] == 0 and pos[other] < self.count:
+                self.remove(other)
+        if near[cell] > 0:
+            self.add(cell)
+
+    def copy(self) -> "CandidateCells":
+        clone = super().copy()
+        clone.near = array("h", self.near)
+        clone.stones = bytearray(self.stones)
+        return clone
+
+
+class SearchState:
+    """
+    A mutable game state for search code. It owns a copy of the board and keeps an EmptyCells index,
+    so valid_moves() is a constant-time view instead of a fresh list of tuples per call.
+    push() follows the same rules as the move function above, but changes the state in place and
+    remembers the move on an undo stack, so pop() can take it back in O(1). That way search code can walk
+    a single state down and back up the tree instead of copying the board for every node and rollout.
+    The Zobrist hash of the position is kept up to date in `hash`.
+    With a radius, a CandidateCells index restricts candidate_moves() to the neighbourhood of the stones.
+    With patterns, a gomoku_patterns.PatternScores keeps the line-pattern scores of the cells up to date.
+    """
+
+    def __init__(self, state: GameState, radius: int = None, patterns: bool = False):
+        self.board = np.array(state[0], dtype=np.int8)
+        self.ply = state[1]
+        self.size = np.shape(self.board)[0]
+        self.empties = EmptyCells(self.board)
+        self.candidates = None if radius is None else CandidateCells(self.board, radius)
+        self.patterns = PatternScores(self.board) if patterns else None
+        self.history = []  # the undo stack: the moves pushed on this state, in order
+        _, self.keys, self.side_key = zobrist_keys(self.size)
+        self.hash = state[2] if len(state) > 2 else zobrist_hash(self.board, self.ply)
+
+    def valid_moves(self) -> Sequence[Move]:
+        """
+        The moves available to the player to move, see valid_moves.
+        NB: this is a live view on the index, it changes along with the state. Copy it (list()) to keep it.
+        """
+        if self.ply == 1:
+            middle = self.size // 2
+            return ((middle, middle),)
+        return self.empties
+
+    def candidate_moves(self) -> Sequence[Move]:
+        """
+        The valid moves within the radius of a stone, or all valid moves when the state has no radius, the board is
+        empty or every cell near a stone is taken. Like valid_moves() this is a live view.
+        """
+        if self.candidates is None or self.ply == 1 or len(self.candidates) == 0:
+            return self.valid_moves()
+        return self.candidates
+
+    def check_win(self, last_move: Move) -> bool:
+        return check_win(self.board, last_move)
+
+    def _place(self, row: int, col: int, colour: int):
+        cell = row * self.size + col
+        self.board[row, col] = colour
+        self.empties.remove(cell)
+        if self.candidates is not None:
+            self.candidates.place(cell)
+        if self.patterns is not None:
+            self.patterns.place(cell, colour)
+        self.hash ^= self.keys[colour][cell] ^ self.side_key
+
+    def _take_back(self, row: int, col: int):
+        cell = row * self.size + col
+        colour = self.board[row, col]
+        self.hash ^= self.keys[colour][cell] ^ self.side_key
+        if self.patterns is not None:
+            self.patterns.take_back(cell, int(colour))
+        self.board[row, col] = 0
+        self.empties.add(cell)
+        if self.candidates is not None:
+            self.candidates.take_back(cell)
+
+    def push(self, move: Move) -> Tuple[bool, bool]:
+        """
+        Plays a move on this state. An invalid move leaves the state (and the undo stack) untouched.
+        :param move: a move (tuple indicating location of stone to place)
+        :return: whether the move was valid and whether the move wins the game
+        """
+        row, col = move
+        if move not in self.empties or (self.ply == 1 and move not in self.valid_moves()):
+            return False, False
+        self._place(row, col, 2 if self.ply % 2 else 1)
+        self.ply += 1
+        self.history.append(move)
+        return True, self.check_win(move)
+
+    move = push  # for symmetry with the move function above
+
+    def pop(self) -> Move:
+        """
+        Takes back the last pushed move: board, ply and empty-cell index are restored in O(1).
+        :return: the move that was taken back
+        """
+        move = self.history.pop()
+        self._take_back(move[0], move[1])
+        self.ply -= 1
+        return move
+
+    def last_move(self) -> Move:
+        """The last pushed move, or () when nothing was pushed (like the last_move of a new game)."""
+        return self.history[-1] if self.history else ()
+
+    def canonical_hash(self) -> Tuple[int, int]:
+        """The canonical key of the position and the symmetry that gives it, see canonical_hash."""
+        return canonical_hash(self.board, self.ply)
+
+    def to_state(self, hashed_: bool = False) -> GameState:
+        """A GameState tuple (with its own copy of the board) for code that uses the functions above."""
+        if hashed_:
+            return self.board.copy(), self.ply, self.hash
+        return self.board.copy(), self.ply
+
+    def copy(self) -> "SearchState":
+        clone = copy.copy(self)
+        clone.board = self.board.copy()
+        clone.empties = self.empties.copy()
+        if self.candidates is not None:
+            clone.candidates = self.candidates.copy()
+        if self.patterns is not None:
+            clone.patterns = self.patterns.copy()
+        clone.history = list(self.history)
+        return clone
+
+
 def pretty_board(board: Board):
     """
     Function to print the board to the standard out
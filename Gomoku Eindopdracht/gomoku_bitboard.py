@@ -0,0 +1,334 @@
+# Bitboard implementation of the gomoku engine.
+# It offers the same starting_state/move/check_win/valid_moves functions as gomoku.py,
+# but stores the stones of each colour as a packed Python int instead of a numpy array.
+# Switch to it via the bitboard_ flag of Competition and ahmetPlayer.
+# Its SearchState keeps only the two ints of the stones, so a push or pop is one OR or XOR instead of a numpy write.
+# test_equivalence (collected by pytest through test_gomoku_bitboard.py) checks both engines against each other.
+
+import copy, random
+from functools import lru_cache
+from typing import NamedTuple, Tuple, List
+
+import numpy as np
+import gomoku
+from gomoku import Move, SIZE
+
+
+class BitBoard(NamedTuple):
+    """
+    Immutable board: bit (row * (size + 1) + col) of `one` / `two` is set when a stone
+    of colour 1 / 2 is on (row, col). Every row is followed by an always empty padding bit,
+    so shifting along a row or a diagonal can never wrap around to the next row.
+    """
+
+    size: int
+    one: int
+    two: int
+
+
+GameState = Tuple[BitBoard, int]  # The board plus the ply number, just like gomoku.GameState.
+
+
+@lru_cache(maxsize=None)
+def _geometry(bsize: int):
+    """
+    Precomputes the masks that only depend on the board size.
+    :return: row stride, mask of all board cells, bit of the centre, the four line directions
+    (as shift distances), the five-in-a-line masks per direction and the move tuple per bit index
+    """
+    stride = bsize + 1
+    full = 0
+    cells = [None] * (bsize * stride)
+    for row in range(bsize):
+        for col in range(bsize):
+            full |= 1 << (row * stride + col)
+            cells[row * stride + col] = (row, col)
+    centre = bsize // 2
+    directions = (1, stride, stride + 1, stride - 1)
+    spreads = tuple(sum(1 << (k * d) for k in range(5)) for d in directions)
+    return stride, full, (centre, centre), directions, spreads, cells
+
+
+def starting_state(bsize_: int = SIZE) -> GameState:
+    """
+    Creates a new game (start state of the game) with an empty bitboard
+    :param bsize_: the size of the board
+    :return: a new empty board, on the first ply (half-move) to make
+    """
+    return BitBoard(bsize_, 0, 0), 1
+
+
+def valid_moves(state: GameState) -> List[Move]:
+    """
+    A function to check which moves are available to the agent.
+    Returns the same moves in the same (row-major) order as gomoku.valid_moves.
+    :param state: the state of the game
+    :return: a list of valid moves (tuples of 2 integers indicating locations on the board)
+    """
+    board, ply = state
+    stride, full, centre, _, _, cells = _geometry(board.size)
+    if ply == 1:
+        return [centre]
+    empty = full & ~(board.one | board.two)
+    moves = []
+    while empty:
+        low = empty & -empty
+        moves.append(cells[low.bit_length() - 1])
+        empty ^= low
+    return moves
+
+
+def check_win(board: BitBoard, last_move: Move) -> bool:
+    """This method checks whether the last move played wins the game.
+    The rule for winning is: /exactly/ 5 stones line up (so not 6 or more),
+    horizontally, vertically, or diagonally.
+    Instead of walking along the lines, the runs of five are found with shifts and ANDs."""
+    if last_move == None or last_move == ():
+        return False
+    stride, _, _, directions, spreads, _ = _geometry(board.size)
+    index = last_move[0] * stride + last_move[1]
+    if (board.one >> index) & 1:
+        stones = board.one
+    elif (board.two >> index) & 1:
+        stones = board.two
+    else:
+        return False
+    for d, spread in zip(directions, spreads):
+        pairs = stones & (stones >> d)
+        fives = pairs & (pairs >> (2 * d)) & (stones >> (4 * d))  # bit i: stones on i .. i+4d
+        exact = fives & ~(stones << d) & ~(stones >> (5 * d))  # and no stone on i-d or i+5d
+        first = index - 4 * d  # the lowest start of a five that still covers the last move
+        window = spread << first if first >= 0 else spread >> -first
+        if exact & window:
+            return True
+    return False
+
+
+def move(state: GameState, move: Move) -> Tuple[bool, bool, GameState]:
+    """
+    A function to get to a new state when playing a move.
+    Unlike gomoku.move the given state is left untouched, since bitboards are immutable.
+    :param state: the current state of the game
+    :param move: a move (tuple indicating location of stone to place)
+    :return: whether the move was valid, whether the move wins the game, and the new game state
+    """
+    board, ply = state
+    stride, _, centre, _, _, _ = _geometry(board.size)
+    if not (0 <= move[0] < board.size and 0 <= move[1] < board.size):
+        return False, False, state
+    bit = 1 << (move[0] * stride + move[1])
+    if (board.one | board.two) & bit:
+        return False, False, state
+    if ply == 1 and tuple(move) != centre:
+        return False, False, state
+    if ply % 2:
+        board = BitBoard(board.size, board.one, board.two | bit)
+    else:
+        board = BitBoard(board.size, board.one | bit, board.two)
+    return True, check_win(board, move), (board, ply + 1)
+
+
+def from_numpy_state(state: gomoku.GameState) -> GameState:
+    """Converts a gomoku.GameState (numpy board) into the equivalent bitboard GameState."""
+    board = state[0]
+    bsize = np.shape(board)[0]
+    stride = _geometry(bsize)[0]
+    one = two = 0
+    for row, col in zip(*np.where(board == 1)):
+        one |= 1 << (int(row) * stride + int(col))
+    for row, col in zip(*np.where(board == 2)):
+        two |= 1 << (int(row) * stride + int(col))
+    return BitBoard(bsize, one, two), state[1]
+
+
+def _unpack(bits: int, bsize: int) -> np.ndarray:
+    """The cells of a bitboard colour as a (bsize, bsize) array of 0/1 (numpy unpacks the bytes, no loop over the cells)."""
+    stride = _geometry(bsize)[0]
+    raw = np.frombuffer(bits.to_bytes(bsize * stride // 8 + 1, "little"), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder="little")[: bsize * stride].reshape(bsize, stride)[:, :bsize]
+
+
+def to_numpy_state(state: GameState) -> gomoku.GameState:
+    """Converts a bitboard GameState into the equivalent gomoku.GameState (numpy board)."""
+    board, ply = state
+    array = (_unpack(board.one, board.size) + 2 * _unpack(board.two, board.size)).astype(np.int8)
+    return array, ply
+
+
+def pretty_board(board: BitBoard):
+    """Function to print the board to the standard out, see gomoku.pretty_board"""
+    gomoku.pretty_board(to_numpy_state((board, 1))[0])
+
+
+@lru_cache(maxsize=None)
+def _cell_bits(bsize: int) -> Tuple[int, ...]:
+    """The bit index (row * (bsize + 1) + col) of every flat cell index (row * bsize + col)."""
+    stride = _geometry(bsize)[0]
+    return tuple(row * stride + col for row in range(bsize) for col in range(bsize))
+
+
+class SearchState(gomoku.SearchState):
+    """
+    gomoku.SearchState whose stones are only kept as the two bitboard ints `one` and `two`, which push and pop update in place.
+    The empty-cell, candidate and pattern indices are the same as in gomoku.SearchState; check_win counts the stones along
+    the four lines through the last move with bit tests. `board` is a numpy copy made from the bits on request, for the code
+    that needs one (threat search, batched roll-outs): it is a snapshot, writing to it doesn't change the state.
+    Accepts numpy as well as bitboard GameStates.
+    """
+
+    def __init__(self, state, radius: int = None, patterns: bool = False):
+        if isinstance(state[0], BitBoard):
+            state = to_numpy_state(state)
+        super().__init__(state, radius, patterns)  # its board assignment fills the bits
+        self.bitOf = _cell_bits(self.size)
+        self.directions = _geometry(self.size)[3]
+
+    @property
+    def board(self) -> np.ndarray:
+        return to_numpy_state((self.bitboard(), self.ply))[0]
+
+    @board.setter
+    def board(self, board: np.ndarray):
+        bits = from_numpy_state((board, 0))[0]
+        self.size, self.one, self.two = bits.size, bits.one, bits.two
+
+    def bitboard(self) -> BitBoard:
+        """The position as an (immutable) BitBoard."""
+        return BitBoard(self.size, self.one, self.two)
+
+    def check_win(self, last_move: Move) -> bool:
+        """
+        Whether the stone on last_move is part of an exact five.
+
+        Time-Complexity O(1): at most 5 bit tests per side of each of the 4 lines.
+        """
+        if last_move == None or last_move == ():
+            return False
+        index = self.bitOf[last_move[0] * self.size + last_move[1]]
+        stones = self.one if (self.one >> index) & 1 else self.two if (self.two >> index) & 1 else 0
+        if not stones:
+            return False
+        for d in self.directions:  # the padding bit after every row stops a run at the edge of the board
+            run = 1
+            k = index + d
+            while run < 6 and (stones >> k) & 1:
+                run += 1
+                k += d
+            k = index - d
+            while run < 6 and k >= 0 and (stones >> k) & 1:
+                run += 1
+                k -= d
+            if run == 5:
+                return True
+        return False
+
+    def _place(self, row: int, col: int, colour: int):
+        cell = row * self.size + col
+        if colour == 1:
+            self.one |= 1 << self.bitOf[cell]
+        else:
+            self.two |= 1 << self.bitOf[cell]
+        self.empties.remove(cell)
+        if self.candidates is not None:
+            self.candidates.place(cell)
+        if self.patterns is not None:
+            self.patterns.place(cell, colour)
+        self.hash ^= self.keys[colour][cell] ^ self.side_key
+
+    def _take_back(self, row: int, col: int):
+        cell = row * self.size + col
+        bit = 1 << self.bitOf[cell]
+        if self.one & bit:
+            colour = 1
+            self.one ^= bit
+        else:
+            colour = 2
+            self.two ^= bit
+        self.hash ^= self.keys[colour][cell] ^ self.side_key
+        if self.patterns is not None:
+            self.patterns.take_back(cell, colour)
+        self.empties.add(cell)
+        if self.candidates is not None:
+            self.candidates.take_back(cell)
+
+    def to_state(self, hashed_: bool = False):
+        board = self.board
+        return (board, self.ply, self.hash) if hashed_ else (board, self.ply)
+
+    def copy(self) -> "SearchState":
+        clone = copy.copy(self)
+        clone.empties = self.empties.copy()
+        if self.candidates is not None:
+            clone.candidates = self.candidates.copy()
+        if self.patterns is not None:
+            clone.patterns = self.patterns.copy()
+        clone.history = list(self.history)
+        return clone
+
+
+def test_equivalence(nof_games: int = 200, seed: int = 0) -> bool:
+    """
+    Plays random games on both engines at once and checks that valid_moves, move and
+    check_win agree on every ply. Every game also tries a few invalid moves.
+    The games are also pushed on a SearchState of both engines (with a candidate radius), which must agree on
+    the wins, boards, hashes and candidate moves, and must be back at the start after popping every move.
+    :return: True if both engines behaved identically
+    """
+    rng = random.Random(seed)
+    for game in range(nof_games):
+        bsize = rng.choice([5, 6, 7, 9, 13, 19])
+        np_state = gomoku.starting_state(bsize)
+        bb_state = starting_state(bsize)
+        np_search = gomoku.SearchState(np_state, radius=2)
+        bb_search = SearchState(bb_state, radius=2)
+        over = False
+        while not over:
+            np_moves = gomoku.valid_moves(np_state)
+            bb_moves = valid_moves(bb_state)
+            if [tuple(map(int, m)) for m in np_moves] != bb_moves:
+                print("valid_moves differ in game", game, "at ply", bb_state[1])
+                return False
+            if rng.random() < 0.1:  # an occupied or (at ply 1) off-centre square
+                illegal = (rng.randrange(bsize), rng.randrange(bsize))
+                if illegal not in bb_moves:
+                    np_result = gomoku.move(np_state, illegal)
+                    bb_result = move(bb_state, illegal)
+                    if np_result[:2] != bb_result[:2]:
+                        print("invalid move handled differently in game", game)
+                        return False
+            action = rng.choice(bb_moves)
+            np_ok, np_win, np_state = gomoku.move(np_state, action)
+            bb_ok, bb_win, bb_state = move(bb_state, action)
+            if (np_ok, np_win) != (bb_ok, bb_win):
+                print("move", action, "differs in game", game, "at ply", bb_state[1])
+                return False
+            if not np.array_equal(np_state[0], to_numpy_state(bb_state)[0]):
+                print("boards differ in game", game, "at ply", bb_state[1])
+                return False
+            if np_search.push(action) != (np_ok, np_win) or bb_search.push(action) != (bb_ok, bb_win):
+                print("SearchState.push", action, "differs in game", game, "at ply", bb_state[1])
+                return False
+            if (np_search.hash != bb_search.hash or not np.array_equal(np_search.board, bb_search.board)
+                    or list(np_search.candidate_moves()) != list(bb_search.candidate_moves())):
+                print("SearchStates differ in game", game, "at ply", bb_state[1])
+                return False
+            over = np_win or len(valid_moves(bb_state)) == 0
+        while bb_search.history:
+            bb_search.pop()
+        if bb_search.one or bb_search.two or bb_search.hash != SearchState(starting_state(bsize)).hash:
+            print("SearchState not restored by pop in game", game)
+            return False
+        # a final sweep over all stones catches differences for moves other than the last one
+        for row in range(bsize):
+            for col in range(bsize):
+                stone = np_state[0][row][col] != 0
+                if stone and gomoku.check_win(np_state[0], (row, col)) != check_win(
+                    bb_state[0], (row, col)
+                ):
+                    print("check_win differs in game", game, "on", (row, col))
+                    return False
+    return True
+
+
+if __name__ == "__main__":
+    print("equivalent" if test_equivalence() else "NOT equivalent")
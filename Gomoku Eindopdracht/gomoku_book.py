@@ -0,0 +1,155 @@
+# Opening book for the gomoku players.
+# The book is a file of fixed-size records (canonical position hash, best move, visits, value), sorted by hash.
+# It is opened with mmap and binary-searched, so opening even a book of millions of positions costs nothing:
+# only the few pages that a lookup touches are read from disk.
+# Positions are stored once for all 8 symmetries of the (square) board: the key is the smallest Zobrist hash over the
+# rotations and reflections (gomoku.canonical_hash), and the move is stored for that orientation and mapped back when it is looked up.
+#
+# Build a book with:  python gomoku_book.py [path] [board size] [plies] [width] [ms per search]
+
+import mmap, os, struct, sys
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import gomoku
+from gomoku import Move, GameState
+
+MAGIC = b"GMBOOK1\0"
+HEADER = struct.Struct("<8sHHI")  # magic, board size, reserved, number of records
+RECORD = struct.Struct("<QHIf")  # canonical hash, move (flat cell index in the canonical orientation), visits, value
+KEY = struct.Struct("<Q")
+
+BookEntry = Tuple[int, int, int, float]  # a record: canonical hash, canonical cell, visits, value
+
+
+class OpeningBook:
+    """A read-only, memory-mapped opening book file."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, _, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not an opening book" % path)
+
+    def find(self, key: int) -> Optional[BookEntry]:
+        """
+        The record with the given canonical hash, or None.
+
+        Time-Complexity O(log n): a binary search over the n sorted records.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * RECORD.size
+            found = KEY.unpack_from(self.data, offset)[0]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return RECORD.unpack_from(self.data, offset)
+        return None
+
+    def lookup(self, state: GameState) -> Optional[Tuple[Move, int, float]]:
+        """The book move for the position (in the orientation of the given board), with its visits and value, or None."""
+        board, ply = state[0], state[1]
+        if np.shape(board)[0] != self.size:
+            return None
+        key, t = gomoku.canonical_hash(board, ply)
+        entry = self.find(key)
+        if entry is None:
+            return None
+        return gomoku.inverse_move(divmod(entry[1], self.size), t, self.size), entry[2], entry[3]
+
+    def move(self, state: GameState, maxPly: int) -> Optional[Move]:
+        """The book move for the position when it is at most maxPly and the move is valid (hash collisions are possible), or None."""
+        if state[1] > maxPly:
+            return None
+        found = self.lookup(state)
+        if found is None or state[0][found[0]] != 0:
+            return None
+        return found[0]
+
+    def entries(self) -> Iterator[BookEntry]:
+        for i in range(self.count):
+            yield RECORD.unpack_from(self.data, HEADER.size + i * RECORD.size)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def book_entry(state: GameState, move: Move, visits: int, value: float) -> BookEntry:
+    """The record of a searched position: its canonical hash and the move mapped to the canonical orientation."""
+    bsize = np.shape(state[0])[0]
+    key, t = gomoku.canonical_hash(state[0], state[1])
+    row, col = gomoku.transform_move(move, t, bsize)
+    return key, row * bsize + col, visits, value
+
+
+def write_book(path: str, bsize: int, entries: Iterable[BookEntry]):
+    """Writes the entries as a book file. Of the entries of the same position, the one with the most visits is kept."""
+    best = {}
+    for entry in entries:
+        if entry[0] not in best or entry[2] > best[entry[0]][2]:
+            best[entry[0]] = entry
+    with open(path + ".tmp", "wb") as out:
+        out.write(HEADER.pack(MAGIC, bsize, 0, len(best)))
+        for key in sorted(best):
+            out.write(RECORD.pack(*best[key]))
+    os.replace(path + ".tmp", path)
+
+
+def build_book(path: str, bsize: int = gomoku.SIZE, plies: int = 4, width: int = 3, max_time_to_move: int = 5000, player=None):
+    """
+    Builds (or extends) a book by searching every position of the opening tree: from the start position the `width` most
+    visited moves of every search are followed, up to `plies` stones. Every searched position gets a record.
+    :param player: the searching player (with a searchTree method like ahmetPlayer), by default an ahmetPlayer
+    """
+    from ahmet_agent import ahmetPlayer  # ahmet_agent uses this module itself
+
+    player = player or ahmetPlayer(tacticsMs=0)
+    entries = []
+    if os.path.exists(path):
+        book = OpeningBook(path)
+        entries = list(book.entries()) if book.size == bsize else []
+        book.close()
+    seen = set()
+    frontier = [gomoku.starting_state(bsize)]
+    for ply in range(1, plies + 1):
+        following = []
+        for state in frontier:
+            key = gomoku.canonical_hash(state[0], state[1])[0]
+            if key in seen:  # a symmetric version was searched already
+                continue
+            seen.add(key)
+            if state[1] == 1:  # the first stone can only go to the centre, there is nothing to search
+                following.append(gomoku.move(state, gomoku.valid_moves(state)[0])[2])
+                continue
+            player.new_game(state[1] % 2 == 1)
+            _, root = player.searchTree((state[0].copy(), state[1]), (), player.startTimer(max_time_to_move))
+            children = sorted((child for child in root.children if child.N > 0), key=lambda child: child.N, reverse=True)
+            if not children:
+                continue
+            best = max(children, key=lambda child: child.Q / child.N)
+            entries.append(book_entry(state, best.lastMove, best.N, best.Q / best.N))
+            print("ply %2d  %-8s  visits %6d  value %+.3f" % (ply, best.lastMove, best.N, best.Q / best.N))
+            for child in children[:width]:
+                board = state[0].copy()
+                _, win, next_state = gomoku.move((board, state[1]), child.lastMove)
+                if not win:
+                    following.append(next_state)
+        frontier = following
+    write_book(path, bsize, entries)
+    return len(set(entry[0] for entry in entries))
+
+
+if __name__ == "__main__":
+    defaults = ["opening.book", gomoku.SIZE, 4, 3, 5000]
+    arguments = sys.argv[1:] + defaults[len(sys.argv) - 1 :]
+    path, (bsize, plies, width, ms) = arguments[0], map(int, arguments[1:5])
+    print("%d positions in %s" % (build_book(path, bsize, plies, width, ms), path))
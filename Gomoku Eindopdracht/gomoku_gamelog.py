@@ -0,0 +1,107 @@
+# Game log for competitions.
+# Every finished game is appended to the log as one line of JSON: the round, the players (index in the competition and id()),
+# the board size, the moves (flat cell indices, row * size + col), the time of every move and of the engine's move function
+# in milliseconds and the points of both players. The line is flushed as soon as the game is over, so a crash loses at most
+# the game that was being played, and a competition can be resumed by skipping the pairings that are already in the log.
+# The readers go through the log line by line, so logs of any size can be aggregated without loading them.
+
+import json, os
+from typing import Iterator, Tuple
+
+GameRecord = dict  # the keys are: round, black, white, black_id, white_id, bsize, moves, times, engine_times, points
+
+
+class GameLog:
+    """
+    A game log that is opened for appending (the file is created when it doesn't exist).
+    A last line that was cut off by a crash is removed first, so the next record starts on a line of its own.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.exists(path):
+            with open(path, "rb+") as log:
+                end = log.seek(0, os.SEEK_END)
+                while end > 0:  # back from the end, a block at a time, to the last newline
+                    start = max(end - 65536, 0)
+                    log.seek(start)
+                    newline = log.read(end - start).rfind(b"\n")
+                    if newline >= 0:
+                        break
+                    end = start
+                log.truncate(start + newline + 1 if end > 0 else 0)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: GameRecord):
+        """Appends the record of a finished game and flushes it to the operating system."""
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def game_record(round_: int, black: int, white: int, black_id: str, white_id: str, bsize: int) -> GameRecord:
+    """A new, empty record: the moves, times and points are filled in while the game is played."""
+    return {"round": round_, "black": black, "white": white, "black_id": black_id, "white_id": white_id,
+            "bsize": bsize, "moves": [], "times": [], "engine_times": [], "points": [0.0, 0.0]}
+
+
+def read_games(path: str) -> Iterator[GameRecord]:
+    """
+    The records of the log, one at a time. A line that was cut off (by a crash while writing) is skipped.
+
+    Time-Complexity O(n) for n records, with the memory of one record.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as log:
+        for line in log:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            yield record
+
+
+def pairing(record: GameRecord) -> Tuple[int, int, int, str, str]:
+    """The key of the game in its competition: round, the indices of black and white and their ids."""
+    return record["round"], record["black"], record["white"], record["black_id"], record["white_id"]
+
+
+def next_round(path: str) -> int:
+    """The round after the last round in the log (0 for an empty or missing log)."""
+    return 1 + max((record["round"] for record in read_games(path)), default=-1)
+
+
+def summarise(path: str) -> dict:
+    """
+    Streams the log and sums it up per player id: games, wins, draws, losses, points, moves and thinking time (ms).
+    """
+    players = {}
+    for record in read_games(path):
+        for colour, name in enumerate((record["black_id"], record["white_id"])):
+            mine, theirs = record["points"][colour], record["points"][1 - colour]
+            total = players.setdefault(name, {"games": 0, "wins": 0, "draws": 0, "losses": 0, "points": 0.0, "moves": 0, "time_ms": 0.0})
+            total["games"] += 1
+            total["wins"] += mine > theirs
+            total["draws"] += mine == theirs
+            total["losses"] += mine < theirs
+            total["points"] += mine
+            total["moves"] += len(record["moves"][colour::2])
+            total["time_ms"] += sum(record["times"][colour::2])
+    return players
+
+
+if __name__ == "__main__":
+    import sys
+
+    for name, total in sorted(summarise(sys.argv[1]).items(), key=lambda item: -item[1]["points"]):
+        print("%-40s games: %4d  +%-4d =%-4d -%-4d points: %6.1f  ms/move: %7.1f"
+              % (name, total["games"], total["wins"], total["draws"], total["losses"], total["points"], total["time_ms"] / max(total["moves"], 1)))
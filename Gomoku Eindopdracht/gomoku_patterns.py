@@ -0,0 +1,189 @@
+# Line patterns for move ordering and priors.
+# Every empty cell gets a score per colour: the sum, over the four lines through the cell, of the value of the pattern that
+# a stone of that colour would make there ("open four", "broken three", "dead two", ...). The eight cells around the cell on a line
+# are encoded as a base-3 index (empty / own / blocked), and a table of all 3^8 indices gives the pattern and its score.
+# The indices and scores are kept up to date per stone: only the cells on the four lines through a placed or removed stone change.
+
+from array import array
+from functools import lru_cache
+from typing import Tuple
+
+REACH = 4  # the number of cells on each side of a cell that its line pattern covers
+DIGITS = 2 * REACH
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+EMPTY, OWN, BLOCKED = 0, 1, 2  # the base-3 digits; BLOCKED is a stone of the opponent or the edge of the board
+
+# the patterns a stone makes on a line, from strong to weak, with their scores (an "open" pattern can grow in two ways)
+FIVE, OPEN_FOUR, FOUR, OPEN_THREE, THREE, OPEN_TWO, TWO, ONE, NONE = range(9)
+PATTERN_NAMES = ("five", "open four", "four", "open three", "three", "open two", "two", "one", "none")
+PATTERN_SCORES = (100000, 10000, 1000, 1000, 100, 100, 10, 1, 0)
+
+
+def _digit_position(offset: int) -> int:
+    """The digit of the base-3 index that holds the cell at offset (-REACH .. REACH, not 0) from the centre."""
+    return offset + REACH if offset < 0 else offset + REACH - 1
+
+
+def _completions(line: Tuple[int, ...]) -> set:
+    """The empty cells of the line (of 2 * REACH + 1 cells, OWN in the middle) that make an exact five through the centre."""
+    result = set()
+    for start in range(REACH + 1):  # the windows of five that cover the centre
+        window = line[start : start + 5]
+        if BLOCKED in window or window.count(OWN) != 4:
+            continue
+        before = line[start - 1] if start > 0 else EMPTY
+        after = line[start + 5] if start + 5 < len(line) else EMPTY
+        if before != OWN and after != OWN:
+            result.add(start + window.index(EMPTY))
+    return result
+
+
+@lru_cache(maxsize=None)
+def _classify(line: Tuple[int, ...]) -> int:
+    """The pattern of the line with the centre stone, see FIVE .. NONE. A pattern is open when one more stone can make the pattern above it."""
+    for start in range(REACH + 1):
+        window = line[start : start + 5]
+        before = line[start - 1] if start > 0 else EMPTY
+        after = line[start + 5] if start + 5 < len(line) else EMPTY
+        if window.count(OWN) == 5 and before != OWN and after != OWN:
+            return FIVE
+    fours = _completions(line)
+    if fours:
+        return OPEN_FOUR if len(fours) > 1 else FOUR
+    if not any(BLOCKED not in line[start : start + 5] for start in range(REACH + 1)):
+        return NONE  # no room for a five through the centre
+    best = ONE
+    for cell in range(len(line)):
+        if line[cell] == EMPTY:
+            grown = _classify(line[:cell] + (OWN,) + line[cell + 1 :])
+            if grown in (OPEN_FOUR, FOUR, OPEN_THREE, THREE):
+                best = min(best, grown + 2)  # one stone short of the grown pattern
+    return best
+
+
+@lru_cache(maxsize=None)
+def pattern_table() -> Tuple[bytes, array]:
+    """The pattern (FIVE .. NONE) and the score of every base-3 line index."""
+    patterns = bytearray(3**DIGITS)
+    scores = array("i", bytes(4 * 3**DIGITS))
+    for index in range(3**DIGITS):
+        digits = [(index // 3**position) % 3 for position in range(DIGITS)]
+        line = tuple(digits[:REACH]) + (OWN,) + tuple(digits[REACH:])
+        patterns[index] = _classify(line)
+        scores[index] = PATTERN_SCORES[patterns[index]]
+    return bytes(patterns), scores
+
+
+@lru_cache(maxsize=None)
+def _geometry(bsize: int):
+    """
+    :return: per flat cell index, the (line, centre, weight) triples of the lines that contain it (line = direction * bsize^2 + centre,
+    weight = the value of one OWN digit for that cell in the line's index), and the index of every line on an empty board
+    (the cells beyond the edge are BLOCKED)
+    """
+    area = bsize * bsize
+    updates = [[] for _ in range(area)]
+    walls = array("i", bytes(4 * 4 * area))
+    for d, (dr, dc) in enumerate(DIRECTIONS):
+        for row in range(bsize):
+            for col in range(bsize):
+                line = d * area + row * bsize + col
+                for offset in range(-REACH, REACH + 1):
+                    if offset == 0:
+                        continue
+                    r, c = row + offset * dr, col + offset * dc
+                    weight = 3 ** _digit_position(offset)
+                    if 0 <= r < bsize and 0 <= c < bsize:
+                        updates[r * bsize + c].append((line, row * bsize + col, weight))
+                    else:
+                        walls[line] += BLOCKED * weight
+    return tuple(tuple(cell) for cell in updates), walls
+
+
+class PatternScores:
+    """
+    The line-pattern indices and cell scores of a board, for both colours, kept up to date with place / take_back.
+    index[colour][line] is the base-3 index of a line seen by colour, score[colour][cell] the sum of the scores of the four lines
+    through the cell. Placing or taking back a stone updates the 4 * 2 * REACH lines around it: O(1) per stone.
+    """
+
+    __slots__ = ("size", "updates", "table", "index", "score")
+
+    def __init__(self, board):
+        bsize = self.size = len(board)
+        self.updates, walls = _geometry(bsize)
+        self.table = pattern_table()[1]
+        self.index = (None, array("i", walls), array("i", walls))
+        base = array("i", [sum(self.table[walls[d * bsize * bsize + cell]] for d in range(4)) for cell in range(bsize * bsize)])
+        self.score = (None, base, array("i", base))
+        for row in range(bsize):
+            for col in range(bsize):
+                if board[row][col] != 0:
+                    self.place(row * bsize + col, int(board[row][col]))
+
+    def _update(self, cell: int, colour: int, sign: int):
+        table = self.table
+        own, other = self.index[colour], self.index[3 - colour]
+        ownScore, otherScore = self.score[colour], self.score[3 - colour]
+        for line, centre, weight in self.updates[cell]:
+            old = own[line]
+            own[line] = new = old + sign * weight
+            ownScore[centre] += table[new] - table[old]
+            old = other[line]
+            other[line] = new = old + sign * BLOCKED * weight
+            otherScore[centre] += table[new] - table[old]
+
+    def place(self, cell: int, colour: int):
+        """A stone of colour was placed on the flat cell index."""
+        self._update(cell, colour, 1)
+
+    def take_back(self, cell: int, colour: int):
+        """The stone of colour on the flat cell index was taken back."""
+        self._update(cell, colour, -1)
+
+    def copy(self) -> "PatternScores":
+        clone = PatternScores.__new__(PatternScores)
+        clone.size, clone.updates, clone.table = self.size, self.updates, self.table
+        clone.index = (None, array("i", self.index[1]), array("i", self.index[2]))
+        clone.score = (None, array("i", self.score[1]), array("i", self.score[2]))
+        return clone
+
+    def priority(self, cell: int, colour: int) -> int:
+        """How urgent the (empty) cell is for colour: its own score plus half of the opponent's (blocking)."""
+        return self.score[colour][cell] + self.score[3 - colour][cell] // 2
+
+    def pattern(self, cell: int, colour: int, direction: int) -> str:
+        """The name of the pattern a stone of colour on cell makes along DIRECTIONS[direction]."""
+        return PATTERN_NAMES[pattern_table()[0][self.index[colour][direction * self.size * self.size + cell]]]
+
+
+if __name__ == "__main__":
+    import random, time
+    import numpy as np
+    import gomoku
+
+    # the incremental scores must equal the scores of a fresh PatternScores, after random pushes and pops
+    rng = random.Random(0)
+    for game in range(30):
+        state = gomoku.SearchState(gomoku.starting_state(rng.choice([7, 9, 19])), patterns=True)
+        for step in range(150):
+            if state.history and rng.random() < 0.3:
+                state.pop()
+            elif len(state.valid_moves()) > 0:
+                state.push(rng.choice(state.valid_moves()))
+            fresh = PatternScores(state.board)
+            assert fresh.index == state.patterns.index and fresh.score == state.patterns.score, (game, step)
+    print("incremental scores equal fresh scores")
+
+    board = np.zeros((19, 19), dtype=np.int8)
+    board[9, 6:9] = 1
+    board[9, 10] = 2
+    scores = PatternScores(board)
+    print("(9,5) for 1:", scores.pattern(9 * 19 + 5, 1, 0), " (9,9) for 1:", scores.pattern(9 * 19 + 9, 1, 0),
+          " (9,5) for 2:", scores.pattern(9 * 19 + 5, 2, 0))
+    state = gomoku.SearchState((board, 5), patterns=True)
+    start = time.perf_counter()
+    for _ in range(1000):
+        state.push(state.valid_moves()[0])
+        state.pop()
+    print("push + pop with pattern scores: %.1f us" % ((time.perf_counter() - start) * 1000))
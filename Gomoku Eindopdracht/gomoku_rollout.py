@@ -0,0 +1,95 @@
+# Rollout (random playout) engine for the MCTS players.
+# A rollout plays random moves on a gomoku.SearchState, checks for a win after every stone
+# (only along the lines through that stone) and stops as soon as the game is decided.
+
+import random
+import numpy as np
+import gomoku
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+
+def _random_candidates(state: gomoku.SearchState, rng):
+    """Yields a random candidate move of the current position until the board is full (the candidates change with every stone)."""
+    while len(state.valid_moves()) > 0:
+        yield rng.choice(state.candidate_moves())
+
+
+def rollout(state: gomoku.SearchState, rng=random, moves: list = None) -> int:
+    """
+    Plays a random game from state until a win or a full board. The moves are pushed on the state
+    and popped again afterwards, so the state is unchanged when the function returns.
+    When the state has a candidate radius, every move is picked from state.candidate_moves() instead.
+    NB: the position itself must not be decided yet (check that with the last move before calling).
+    :param state: the position to play out
+    :param rng: the random generator to use (e.g. a random.Random with its own seed)
+    :param moves: a list to which the moves of the roll-out are appended, in order (e.g. for AMAF statistics)
+    :return: WIN, LOSS or DRAW for the player to move in state
+    """
+    result = DRAW
+    played = 0
+    patterns, state.patterns = state.patterns, None  # every stone is taken back again, so the pattern scores can be left alone
+    if state.ply == 1:  # the first stone can only go to the centre, and can't win
+        state.push(state.valid_moves()[0])
+        played = 1
+    if state.candidates is None:
+        # playing the empty cells in a random order is the same as picking a random empty cell every ply
+        order = list(state.valid_moves())
+        rng.shuffle(order)
+    else:
+        order = _random_candidates(state, rng)
+    for move in order:
+        _, win = state.push(move)
+        played += 1
+        if win:
+            # an odd number of stones means the player to move in the original state placed the last one
+            result = WIN if played % 2 == 1 else LOSS
+            break
+    if moves is not None and played > 0:
+        moves.extend(state.history[-played:])
+    for _ in range(played):
+        state.pop()
+    state.patterns = patterns
+    return result
+
+
+def rollout_batch(state: gomoku.SearchState, K: int, rng: np.random.Generator = None, series: int = 5) -> np.ndarray:
+    """
+    Plays K random games from state in lock-step on a (K, size, size) int8 tensor: every ply places one stone
+    on each unfinished board (the boards play their own random permutation of the empty cells) and checks all of
+    them for a win with one vectorised gomoku.check_win_padded call. This spreads the interpreter overhead over K roll-outs.
+    The boards draw from all empty cells, a candidate radius of the state is not used.
+    NB: like rollout(), the position itself must not be decided yet.
+    :param state: the position to play out (it is not changed)
+    :param K: the number of roll-outs
+    :param rng: a numpy random Generator, by default one seeded from the random module (so random.seed still makes runs reproducible)
+    :param series: the number of stones in a row that wins (GmGameRules.winningSeries)
+    :return: an array with WIN, LOSS or DRAW for the player to move in state, per roll-out
+    """
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    size = state.size
+    results = np.full(K, DRAW, dtype=np.int8)
+    padded = np.pad(state.board, series)
+    padded = np.repeat(padded[None], K, axis=0)
+    cells = np.frombuffer(state.empties.cells, dtype=np.int16)[: state.empties.count].astype(np.intp)
+    order = np.argsort(rng.random((K, len(cells))), axis=1)
+    moves = cells[order]  # (K, m): the random permutation of the empty cells of every roll-out
+    if state.ply == 1:  # the first stone can only go to the centre
+        centre = (size // 2) * size + size // 2
+        moves = np.concatenate([np.full((K, 1), centre), moves[moves != centre].reshape(K, -1)], axis=1)
+    active = np.arange(K)
+    for t in range(moves.shape[1]):
+        colour = 2 if (state.ply + t) % 2 else 1
+        rows, cols = np.divmod(moves[active, t], size)
+        padded[active, rows + series, cols + series] = colour
+        won = gomoku.check_win_padded(padded, active, rows, cols, series)
+        if won.any():
+            # an even t means the player to move in state placed this stone
+            results[active[won]] = WIN if t % 2 == 0 else LOSS
+            active = active[~won]
+            if len(active) == 0:
+                break
+    return results
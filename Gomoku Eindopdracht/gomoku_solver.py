@@ -0,0 +1,259 @@
+# Exact solver for small boards (the 7x7 test boards and smaller).
+# Negamax with alpha-beta pruning and iterative deepening: every iteration searches one ply deeper, until the value of the
+# position is proven (a forced win or loss, or a draw when every line of play ended: in practice where neither colour can
+# make five any more, since a full board is far beyond the depth that fits in the time) or the time is up.
+# A transposition table stores the positions by their canonical Zobrist hash (gomoku.canonical_hash), so the 8 symmetric
+# versions of a position share one entry. The moves are ordered by threat: the line-pattern scores of gomoku_patterns put
+# fives, fours and threes (of both colours) first, and a forced block is the only move that is searched.
+# solverPlayer plays the proven best move, and the best move of the deepest finished iteration otherwise.
+
+import time
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+import gomoku
+from gomoku import Move, GameState
+from gomoku_patterns import PATTERN_SCORES, FIVE
+from gomoku_rollout import WIN, LOSS, DRAW
+from gomoku_table import TranspositionTable
+from basePlayer import basePlayer
+
+MATE = 1000000  # the value of a win on the next move; a win k plies from the root is worth MATE - k
+MATE_BOUND = MATE - 1000  # values beyond this are proven wins (or, negated, losses)
+EXACT, LOWER, UPPER = range(3)  # the kind of value of a table entry: exact, at least (fail high) or at most (fail low)
+
+
+class SolveResult(NamedTuple):
+    result: Optional[int]  # WIN, LOSS or DRAW for the player to move when the value is proven, else None
+    move: Optional[Move]  # the best move (of the deepest finished iteration)
+    value: int  # the negamax value: -(MATE - k) for a loss in k plies, more than MATE_BOUND for a win (at least MATE - k), 0 otherwise
+    depth: int  # the depth of the deepest finished iteration
+    nodes: int
+    timeMs: float
+
+
+class _Timeout(Exception):
+    """Raised inside the search when the deadline has passed."""
+
+
+@lru_cache(maxsize=None)
+def _lines(bsize: int) -> np.ndarray:
+    """The flat cell indices of every five cells in a line (horizontal, vertical and both diagonals), as a (windows, 5) array."""
+    lines = []
+    for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        for row in range(bsize):
+            for col in range(bsize):
+                cells = [(row + k * dr, col + k * dc) for k in range(5)]
+                if all(0 <= r < bsize and 0 <= c < bsize for r, c in cells):
+                    lines.append([r * bsize + c for r, c in cells])
+    return np.array(lines, dtype=np.intp).reshape(-1, 5)
+
+
+class Solver:
+    """
+    Alpha-beta solver with a transposition table that is kept between solve() calls (for positions of the same board size).
+    """
+    def __init__(self, maxEntries: int = 2000000):
+        self.table    = TranspositionTable(maxEntries)  # canonical hash -> (depth, kind, value, canonical cell of the best move, exact)
+        self.size     = None  # the board size of the positions in the table
+        self.nodes    = 0
+        self.deadline = None
+        self.horizons = 0  # the number of times the search stopped at the depth limit instead of at the end of the game
+
+    def solve(self, state: GameState, max_time_ms: float = None, maxDepth: int = None) -> SolveResult:
+        """
+        Searches the position until its value is proven, maxDepth is reached or the time runs out.
+        :param state: the position, with the player to move; it must not be decided yet
+        :param max_time_ms: the time the search may take, in milliseconds (None: no limit)
+        :param maxDepth: the largest depth to search (None: up to the end of the game)
+        """
+        start = time.perf_counter_ns()
+        self.deadline = None if max_time_ms is None else start + int(max_time_ms * 1000000)
+        self.nodes = 0
+        self.state = gomoku.SearchState(state, patterns=True)
+        bsize = self.state.size
+        if bsize != self.size:  # the keys of another board size mean nothing here
+            self.table = TranspositionTable(self.table.maxEntries)
+            self.size = bsize
+        self.flat = self.state.board.ravel()
+        self.scores = (None,) + tuple(np.frombuffer(self.state.patterns.score[colour], dtype=np.int32) for colour in (1, 2))
+        self.perms = gomoku.symmetries(bsize)
+        self.inverse = gomoku.inverse_symmetries(bsize)
+        self.keys = gomoku.symmetry_keys(bsize)
+        self.side = np.uint64(self.state.side_key)
+        self.hashes = gomoku.symmetric_hashes(self.state.board, self.state.ply)
+        self.lines = _lines(bsize)
+
+        empties = len(self.state.empties)
+        result, move, value, depth = None, None, 0, 0
+        for iteration in range(1, min(empties, maxDepth or empties) + 1):
+            self.horizons = 0
+            self.rootMove = None
+            try:
+                # every value is 0 or a win or loss, so a window around 0 tells them apart and prunes much more than a full window;
+                # a winning move is then found by the fail high, a loss is searched again for the move that resists longest
+                found = self.negamax(iteration, -1, 1, 0)
+                if found < 0:
+                    found = self.negamax(iteration, -MATE, MATE, 0)
+            except _Timeout:
+                while self.state.history:
+                    self._pop()
+                break
+            move, value, depth = self.rootMove, found, iteration
+            if abs(value) > MATE_BOUND:
+                result = WIN if value > 0 else LOSS
+                break
+            if self.horizons == 0:  # every line of play was searched to its end
+                result = DRAW
+                break
+        return SolveResult(result, move, value, depth, self.nodes, (time.perf_counter_ns() - start) / 1e6)
+
+    def _push(self, cell: int):
+        colour = 2 if self.state.ply % 2 else 1
+        self.state.push(divmod(cell, self.state.size))
+        self.hashes ^= self.keys[:, colour, cell]
+        self.hashes ^= self.side
+
+    def _pop(self):
+        move = self.state.pop()
+        cell = move[0] * self.state.size + move[1]
+        self.hashes ^= self.keys[:, 2 if self.state.ply % 2 else 1, cell]  # the ply of the stone again after the pop
+        self.hashes ^= self.side
+
+    def _fives(self, colour: int) -> np.ndarray:
+        """The empty cells where a stone of colour makes an exact five (a five scores more than four of anything else)."""
+        return np.flatnonzero((self.scores[colour] >= PATTERN_SCORES[FIVE]) & (self.flat == 0))
+
+    def _can_win(self, me: int) -> Tuple[bool, bool]:
+        """Whether the player to move and the opponent can still make five: whether they have five cells in a line without stones of the other."""
+        stones = self.flat[self.lines]
+        return bool((stones != 3 - me).all(axis=1).any()), bool((stones != me).all(axis=1).any())
+
+    def negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        """
+        The value of the position for the player to move, searched depth plies deep within the window (alpha, beta).
+
+        Time-Complexity O(b^(d/2)) with good move ordering: b moves per position, d the depth.
+        """
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % 256 == 0 and time.perf_counter_ns() > self.deadline:
+            raise _Timeout()
+        state = self.state
+        if len(state.empties) == 0:
+            return 0
+        me = 2 if state.ply % 2 else 1
+        if state.ply == 1:  # the first stone can only go to the centre, and can't win
+            cells = np.array([(state.size // 2) * (state.size + 1)])
+        else:
+            wins = self._fives(me)
+            if len(wins):
+                if ply == 0:
+                    self.rootMove = divmod(int(wins[0]), state.size)
+                return MATE - (ply + 1)
+            cells = None
+        t = int(np.argmin(self.hashes))
+        key = int(self.hashes[t])
+        entry = self.table.get(key)
+        ttCell = None
+        if entry is not None:
+            entryDepth, kind, value, canonicalCell, exact = entry
+            ttCell = int(self.inverse[t][canonicalCell])
+            value = value - ply if value > MATE_BOUND else value + ply if value < -MATE_BOUND else value  # from the node to the root
+            if entryDepth >= depth and ply > 0:
+                if kind == EXACT or (kind == LOWER and value >= beta) or (kind == UPPER and value <= alpha):
+                    self.horizons += not exact
+                    return value
+        meCan, opponentCan = self._can_win(me)
+        if not meCan and (not opponentCan or alpha >= 0):  # at most a draw: enough for a draw or a fail low
+            return 0
+        if not opponentCan and beta <= 0:  # at least a draw: a fail high
+            return 0
+        if depth == 0:
+            self.horizons += 1
+            return 0
+
+        if cells is None:
+            blocks = self._fives(3 - me)
+            if len(blocks) > 1:  # the opponent has two fives, only one of them can be blocked
+                if ply == 0:
+                    self.rootMove = divmod(int(blocks[0]), state.size)
+                return -(MATE - (ply + 2))
+            if len(blocks):
+                cells = blocks
+            else:  # the threats of both colours first
+                empty = np.flatnonzero(self.flat == 0)
+                priority = self.scores[me][empty] + self.scores[3 - me][empty] // 2
+                cells = empty[np.argsort(-priority, kind="stable")]
+        order = cells.tolist()
+        if ttCell is not None and ttCell in order:
+            order.remove(ttCell)
+            order.insert(0, ttCell)
+
+        originalAlpha = alpha
+        horizons = self.horizons
+        bestValue, bestCell = -MATE, order[0]
+        for cell in order:
+            self._push(cell)
+            value = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            self._pop()
+            if value > bestValue:
+                bestValue, bestCell = value, cell
+                if ply == 0:
+                    self.rootMove = divmod(cell, state.size)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        kind = UPPER if bestValue <= originalAlpha else LOWER if bestValue >= beta else EXACT
+        stored = bestValue + ply if bestValue > MATE_BOUND else bestValue - ply if bestValue < -MATE_BOUND else bestValue  # from the node
+        self.table.add(key, (depth, kind, stored, int(self.perms[t][bestCell]), self.horizons == horizons))
+        return bestValue
+
+
+class solverPlayer(basePlayer):
+    """
+    A player that plays the solver's move: the perfect move when the position is proven within the time, otherwise the best move
+    of the deepest finished iteration. The transposition table is kept between moves. lastResult is the SolveResult of the last move.
+    """
+    def __init__(self, black_: bool = True, book_: str = None, bookPlies_: int = 8, safetyMs: float = 50, maxEntries: int = 2000000):
+        super().__init__(black_, book_, bookPlies_)
+        self.solver     = Solver(maxEntries)
+        self.safetyMs   = safetyMs  # the part of the time per move that is not used for searching
+        self.lastResult = None
+
+    def move(self, state: GameState, last_move: Move, max_time_to_move: int = 1000) -> Move:
+        opening = self.bookMove(state)
+        if opening is not None:
+            return opening
+        self.lastResult = self.solver.solve(state, max(max_time_to_move - self.safetyMs, max_time_to_move / 2))
+        if self.lastResult.move is not None:
+            return self.lastResult.move
+        return gomoku.valid_moves(state)[0]  # not even one ply was searched
+
+    def id(self) -> str:
+        return "solver_player"
+
+
+if __name__ == "__main__":
+    # the positions of GmQuickTests: the five and the four are proven at once, the three is not proven within the time
+    positions = {
+        "WinSelf1":         ({(3, 0): 2, (4, 0): 2, (5, 0): 2, (6, 0): 2}, 5, WIN),
+        "PreventWinOther2": ({(2, 0): 1, (3, 0): 1, (4, 0): 1, (5, 0): 1}, 5, LOSS),
+        "PreventAdvanced1": ({(2, 0): 1, (3, 0): 1, (4, 0): 1, (6, 6): 2}, 5, None),
+    }
+    solver = Solver()
+    for name, (stones, ply, expected) in positions.items():
+        board = np.zeros((7, 7), dtype=np.int8)
+        for cell, colour in stones.items():
+            board[cell] = colour
+        found = solver.solve((board, ply), 2000)
+        print("%-17s %s (%s)" % (name, found, "proven" if found.result is not None else "not proven"))
+
+    # a 5x5 position that is proven to be a draw: every line of play ends where neither colour can make five any more
+    # (the empty 5x5 board is not proven within a minute)
+    board = np.zeros((5, 5), dtype=np.int8)
+    for cell, colour in {(0, 2): 1, (0, 4): 1, (2, 2): 2, (2, 3): 2, (3, 3): 2, (3, 4): 1, (4, 0): 2, (4, 4): 1}.items():
+        board[cell] = colour
+    found = Solver().solve((board, 9), 10000)
+    print("5x5 midgame: %s (%s)" % (found, "proven" if found.result is not None else "not proven"))
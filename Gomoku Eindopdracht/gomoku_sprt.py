@@ -0,0 +1,115 @@
+# Head-to-head matches with a sequential probability ratio test (SPRT).
+# Two players play pairs of games, one with either colour, so the advantage of moving first cancels out within a pair.
+# After every pair the rating difference is estimated (Elo; for two players the Bradley-Terry estimate is the same number)
+# and the log-likelihood ratio of H1 "the first player is elo1 stronger" against H0 "it is only elo0 stronger" is updated.
+# The match stops as soon as the ratio crosses a bound, which for a clear difference takes far fewer games than a fixed
+# number of rounds at the same error rates alpha (accepting H1 when H0 holds) and beta (accepting H0 when H1 holds).
+# The pairs are counted in the five classes of their score (0, 1/2, 1, 3/2 or 2 points, the "pentanomial" counts), because
+# the two games of a pair are not independent of each other; the ratio is the normal approximation of the generalised SPRT.
+
+import math
+from typing import List, Tuple
+
+from competition import Competition
+import gomoku_gamelog
+
+H0, H1 = "H0", "H1"
+PRIOR = (0.25, 0, 0.5, 0, 0.25)  # the pentanomial counts of one pair of two independent games with a 50% score
+
+
+def score_from_elo(elo: float) -> float:
+    """The expected score (per game, 0 .. 1) of a player that is elo points stronger."""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_from_score(score: float) -> float:
+    """The rating difference that gives the expected score (0 < score < 1)."""
+    return -400 * math.log10(1 / score - 1)
+
+
+def pentanomial_stats(pairs: List[float]) -> Tuple[float, float]:
+    """
+    The mean and variance of the score per game over the pairs, with pentanomial counts pairs[k] of pairs that scored k / 2 points.
+    The counts start from one pair of an even match (PRIOR), without it the variance of a few equal pairs would be 0 and the
+    test would stop at once.
+    """
+    counts = [count + prior for count, prior in zip(pairs, PRIOR)]
+    total = sum(counts)
+    mean = sum(count * k / 4 for k, count in enumerate(counts)) / total
+    variance = sum(count * (k / 4 - mean) ** 2 for k, count in enumerate(counts)) / total
+    return mean, variance
+
+
+def llr(pairs: List[float], elo0: float, elo1: float) -> float:
+    """The log-likelihood ratio of H1 (elo1) against H0 (elo0) after the pairs (pentanomial counts)."""
+    n = sum(pairs)
+    if n == 0:
+        return 0.0
+    mean, variance = pentanomial_stats(pairs)
+    s0, s1 = score_from_elo(elo0), score_from_elo(elo1)
+    return n * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+
+
+def sprt_bounds(alpha: float, beta: float) -> Tuple[float, float]:
+    """The lower bound (accept H0) and the upper bound (accept H1) of the log-likelihood ratio."""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def elo_estimate(pairs: List[float]) -> Tuple[float, float, float]:
+    """The rating difference and its 95% confidence interval after the pairs (pentanomial counts)."""
+    n = sum(pairs)
+    mean, variance = pentanomial_stats(pairs)
+    margin = 1.96 * math.sqrt(variance / max(n, 1))
+    clip = lambda score: min(max(score, 1e-6), 1 - 1e-6)
+    return elo_from_score(clip(mean)), elo_from_score(clip(mean - margin)), elo_from_score(clip(mean + margin))
+
+
+def play_sprt(player, opponent, elo0: float = 0, elo1: float = 20, alpha: float = 0.05, beta: float = 0.05, max_pairs: int = 1000,
+              bsize: int = 19, maxtime_per_move: int = 1000, tolerance: float = 0.05, log_path: str = None, verbose: bool = True) -> dict:
+    """
+    Plays pairs of games between player and opponent until the SPRT accepts H0 or H1, or max_pairs pairs were played.
+    :param log_path: a gomoku_gamelog file to which every game is appended
+    :return: the outcome: "result" (H0, H1 or None when max_pairs ran out), "llr" and its "bounds", the number of "pairs",
+    the "pentanomial" counts, the "wdl" (wins, draws, losses) of player and its "elo" estimate with the 95% "elo_interval"
+    """
+    competition = Competition(bsize)
+    competition.register_player(player)
+    competition.register_player(opponent)
+    competition.new_results(maxtime_per_move)
+    lower, upper = sprt_bounds(alpha, beta)
+    pairs = [0] * 5
+    wdl = [0, 0, 0]
+    ratio, result = 0.0, None
+    log = gomoku_gamelog.GameLog(log_path) if log_path else None
+    try:
+        for pair in range(max_pairs):
+            points = 0.0
+            for black, white in ((0, 1), (1, 0)):
+                record = competition.play_game(black, white, maxtime_per_move, tolerance, round_=pair)
+                competition.add_result(record, log)
+                mine = record["points"][black]  # the points of player (index 0) in this game
+                points += mine
+                wdl[0 if mine == 1 else 1 if mine == 0.5 else 2] += 1
+            pairs[int(points * 2)] += 1
+            ratio = llr(pairs, elo0, elo1)
+            if verbose:
+                elo, low, high = elo_estimate(pairs)
+                print("pair %4d  W-D-L %d-%d-%d  elo %+6.1f [%+6.1f, %+6.1f]  llr %+5.2f [%+.2f, %+.2f]"
+                      % (pair + 1, *wdl, elo, low, high, ratio, lower, upper))
+            if ratio <= lower or ratio >= upper:
+                result = H0 if ratio <= lower else H1
+                break
+    finally:
+        if log is not None:
+            log.close()
+    elo, low, high = elo_estimate(pairs)
+    return {"result": result, "llr": ratio, "bounds": (lower, upper), "pairs": sum(pairs), "pentanomial": pairs,
+            "wdl": tuple(wdl), "elo": elo, "elo_interval": (low, high)}
+
+
+if __name__ == "__main__":
+    from ahmet_agent import ahmetPlayer
+
+    # is the candidate radius worth it on a 9x9 board?
+    outcome = play_sprt(ahmetPlayer(radius=2), ahmetPlayer(), elo0=0, elo1=50, bsize=9, maxtime_per_move=200, max_pairs=100)
+    print(outcome)
@@ -0,0 +1,74 @@
+# Transposition table for the search code.
+# A TranspositionTable stores values by (Zobrist) hash, so a position that is reached by different move orders is searched
+# only once; its memory is bounded by evicting the least recently used entry. ahmetTTPlayer stores TTEntry's (MCTS statistics)
+# in it, gomoku_solver its alpha-beta bounds.
+
+from collections import OrderedDict
+
+
+class TTEntry:
+    """
+    The statistics of one position in the transposition table. It plays the role of a GameTreeNode,
+    but it is shared by every move order that leads to the position, so it has no parent and no children:
+    it only remembers which moves were expanded, the child positions are looked up by their hash.
+    """
+    __slots__ = ("ply", "lastMove", "win", "nValid", "moves", "N", "Q")
+
+    def __init__(self, state, lastMove=None, win=None):
+        """:param state: the gomoku.SearchState, positioned at this entry while the entry is created."""
+        self.ply      = state.ply
+        self.lastMove = lastMove # the move by which the position was first reached (used by the roll-out)
+        self.win      = state.check_win(lastMove) if win is None else win
+        self.nValid   = len(state.candidate_moves())
+        self.moves    = []       # the expanded moves
+        self.N        = 0
+        self.Q        = 0
+
+    def isTerminal(self):
+        """Time-Complexity O(1): both the win and the number of valid moves were stored when the entry was created."""
+        return self.win or self.nValid == 0
+
+    def isFullyExpanded(self):
+        """Time-Complexity O(1): compares the length of a list with a stored count."""
+        return len(self.moves) == self.nValid
+
+
+class TranspositionTable:
+    """
+    Hash-keyed store of TTEntry's, so that a position that is reached by different move orders is searched only once.
+    The memory is bounded: when more than maxEntries positions are stored, the least recently used one is evicted.
+    """
+    def __init__(self, maxEntries: int = 200000):
+        self.entries    = OrderedDict() # zobrist hash -> TTEntry, from least to most recently used
+        self.maxEntries = maxEntries
+        self.hits       = 0
+        self.misses     = 0
+        self.evictions  = 0
+
+    def get(self, key):
+        """
+        Returns the entry of the position with the given hash (and marks it as recently used), or None.
+
+        Time-Complexity O(1): a dictionary lookup plus moving the key to the end of the ordered dictionary.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def add(self, key, entry):
+        """
+        Stores a new entry, evicting the least recently used one when the table is full.
+
+        Time-Complexity O(1): an insertion and possibly a removal at the front of the ordered dictionary.
+        """
+        self.entries[key] = entry
+        if len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
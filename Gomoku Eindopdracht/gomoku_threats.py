@@ -0,0 +1,264 @@
+# Threat-space search for the gomoku engine.
+# Only forcing moves are searched: fours (a stone after which one more stone makes an exact five) and, if asked,
+# open threes. That is enough to find a forced win (VCF, "victory by continuous fours") of the player to move,
+# or a forced win of the opponent that has to be blocked, in a few milliseconds, so MCTS doesn't have to rediscover it.
+# The threats are found by looking at all five-in-a-line windows of the board at once (numpy), on a gomoku.SearchState
+# that is walked down and up with push/pop.
+
+import time
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+import gomoku
+from gomoku import Move
+from gomoku_rollout import WIN, LOSS
+
+WALL = 3  # the value of the cells around the board
+
+
+class _Timeout(Exception):
+    """Raised inside the search when the deadline has passed."""
+
+
+@lru_cache(maxsize=None)
+def _windows(bsize: int, length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    All windows of length cells on a line (horizontal, vertical and both diagonals) of a bsize board.
+    :return: the flat indices of the cells of every window and of the two cells just outside it (its flanks),
+    both as indices into the board padded with one WALL cell on every side
+    """
+    stride = bsize + 2
+    cells, flanks = [], []
+    for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        for row in range(bsize):
+            for col in range(bsize):
+                last_row, last_col = row + (length - 1) * dr, col + (length - 1) * dc
+                if not (0 <= last_row < bsize and 0 <= last_col < bsize):
+                    continue
+                cells.append([(row + k * dr + 1) * stride + col + k * dc + 1 for k in range(length)])
+                flanks.append([(row - dr + 1) * stride + col - dc + 1, (last_row + dr + 1) * stride + last_col + dc + 1])
+    return np.array(cells, dtype=np.intp).reshape(-1, length), np.array(flanks, dtype=np.intp).reshape(-1, 2)
+
+
+def _padded(state: gomoku.SearchState) -> np.ndarray:
+    return np.pad(state.board, 1, constant_values=WALL).ravel()
+
+
+def _to_moves(cells: np.ndarray, bsize: int) -> List[Move]:
+    rows, cols = np.divmod(np.unique(cells), bsize + 2)
+    return list(zip((rows - 1).tolist(), (cols - 1).tolist()))
+
+
+def _empties_of(board: np.ndarray, windows: np.ndarray, colour: int, own: int, empty: int, flanks: np.ndarray = None) -> np.ndarray:
+    """The empty cells of the windows with exactly `own` stones of colour and `empty` empty cells (and no own stone on a flank)."""
+    values = board[windows]
+    selected = ((values == colour).sum(axis=1) == own) & ((values == 0).sum(axis=1) == empty)
+    if flanks is not None:
+        selected &= (board[flanks] != colour).all(axis=1)
+    chosen = windows[selected]
+    return chosen[board[chosen] == 0]
+
+
+def five_moves(state: gomoku.SearchState, colour: int) -> List[Move]:
+    """The moves that give colour an exact five (the flanks of the window must not hold a stone of colour, or it would be six or more)."""
+    windows, flanks = _windows(state.size, 5)
+    return _to_moves(_empties_of(_padded(state), windows, colour, 4, 1, flanks), state.size)
+
+
+def four_moves(state: gomoku.SearchState, colour: int) -> List[Move]:
+    """The moves after which colour threatens to make an exact five with its next stone."""
+    windows, flanks = _windows(state.size, 5)
+    return _to_moves(_empties_of(_padded(state), windows, colour, 3, 2, flanks), state.size)
+
+
+def three_moves(state: gomoku.SearchState, colour: int) -> List[Move]:
+    """The moves that make an open three for colour: three stones inside six cells whose two end cells are empty."""
+    windows, _ = _windows(state.size, 6)
+    board = _padded(state)
+    windows = windows[(board[windows[:, 0]] == 0) & (board[windows[:, 5]] == 0)]
+    return _to_moves(_empties_of(board, windows[:, 1:5], colour, 2, 2), state.size)
+
+
+def three_defences(state: gomoku.SearchState, colour: int) -> List[Move]:
+    """The empty cells of the open threes of colour: the moves that (might) stop a three from becoming an open four."""
+    windows, _ = _windows(state.size, 6)
+    board = _padded(state)
+    values = board[windows]
+    selected = (values[:, 0] == 0) & (values[:, 5] == 0) & ((values[:, 1:5] == colour).sum(axis=1) == 3) & ((values[:, 1:5] == 0).sum(axis=1) == 1)
+    chosen = windows[selected]
+    return _to_moves(chosen[board[chosen] == 0], state.size)
+
+
+class ThreatSearch:
+    """
+    One search for forcing sequences on a SearchState, with a deadline (time.perf_counter_ns) and a cache of positions
+    (by Zobrist hash) that are known not to be won within a given depth.
+    With threes=True the attacker may also play open threes. The defender then gets the cells of the threes and its own
+    fours as replies, as in threat-space search; other replies are not tried, so that part is a heuristic, while the
+    search with fours only (VCF) is exact.
+    """
+    def __init__(self, state: gomoku.SearchState, deadline: int, threes: bool = False, maxDepth: int = 12):
+        self.state    = state
+        self.deadline = deadline
+        self.threes   = threes
+        self.maxDepth = maxDepth
+        self.failed   = {}  # (Zobrist hash, attacker, threes) -> the largest depth at which the attacker has no forced win
+        self.nodes    = 0
+
+    def attack(self, attacker: int, depth: int) -> Optional[Move]:
+        """
+        The first move of a forced win for attacker, who is to move, within depth forcing moves, or None.
+
+        Time-Complexity O(b^d): b forcing moves per position, d the depth; in practice only a few fours are available per position.
+        """
+        self.nodes += 1
+        if self.nodes % 64 == 0 and time.perf_counter_ns() > self.deadline:
+            raise _Timeout()
+        state    = self.state
+        defender = 3 - attacker
+        wins     = five_moves(state, attacker)
+        if wins:
+            return wins[0]
+        key = (state.hash, attacker, self.threes)
+        if depth == 0 or self.failed.get(key, -1) >= depth:
+            return None
+        blocks = five_moves(state, defender)
+        if len(blocks) > 1:
+            return None
+        moves = four_moves(state, attacker)
+        if blocks:  # the attacker has to block, which only keeps the initiative if the block is a four itself
+            moves = [move for move in moves if move == blocks[0]]
+        elif self.threes:
+            fours  = set(moves)
+            moves += [move for move in three_moves(state, attacker) if move not in fours]
+        if state.patterns is not None:  # the most promising threats first
+            moves.sort(key=lambda move: -state.patterns.priority(move[0] * state.size + move[1], attacker))
+        for move in moves:
+            state.push(move)
+            defended = self.defend(attacker, depth)
+            state.pop()
+            if not defended:
+                return move
+        self.failed[key] = depth
+        return None
+
+    def defend(self, attacker: int, depth: int) -> bool:
+        """Whether the defender (to move) survives the attacker's last forcing move."""
+        state    = self.state
+        defender = 3 - attacker
+        if five_moves(state, defender):
+            return True
+        threats = five_moves(state, attacker)
+        if len(threats) > 1:
+            return False
+        if threats:
+            replies = threats
+        else:  # an open three
+            replies = three_defences(state, attacker)
+            replies += [move for move in four_moves(state, defender) if move not in replies]
+        for reply in replies:
+            state.push(reply)
+            won = self.attack(attacker, depth - 1) is not None
+            state.pop()
+            if not won:
+                return True
+        return False
+
+
+def _pass(state: gomoku.SearchState, back: bool = False):
+    """Gives the turn to the other player without placing a stone, or (back) undoes that."""
+    state.ply  += -1 if back else 1
+    state.hash ^= state.side_key
+
+
+def _refutation(search: ThreatSearch, attacker: int, first: Move) -> Optional[Move]:
+    """
+    A move of the player to move after which attacker (the opponent) has no forced win any more, or None.
+    The first move of attacker's sequence is tried first, then the cells where attacker makes a four and, when threes count,
+    an open three, and the cells of attacker's open threes. Every candidate is verified by searching attacker's win again.
+    """
+    state = search.state
+    candidates = [first] + four_moves(state, attacker)
+    if search.threes:
+        candidates += three_moves(state, attacker) + three_defences(state, attacker)
+    tried = set()
+    for move in candidates:
+        if move in tried:
+            continue
+        tried.add(move)
+        state.push(move)
+        refuted = search.attack(attacker, search.maxDepth) is None
+        state.pop()
+        if refuted:
+            return move
+    return None
+
+
+def forced_move(state: gomoku.SearchState, max_time_ms: float = 50, threes: bool = False, maxDepth: int = 12) -> Optional[Tuple[Move, int]]:
+    """
+    Looks for forcing play in the position, in this order: a five of the player to move, a five of the opponent that has to
+    be blocked, a forced win of the player to move and a forced win of the opponent (if it were the opponent's turn).
+    The state is left unchanged, also when the time runs out.
+    :param state: the position, with the player to move
+    :param max_time_ms: the time the search may take, in milliseconds
+    :param threes: whether open threes count as forcing moves as well (see ThreatSearch)
+    :param maxDepth: the maximum number of forcing moves of the attacker
+    :return: (move, WIN) with the first move of a forced win, (move, LOSS) with a move after which the opponent has no forced
+    win any more (the block of its five, or a verified refutation of its sequence), or None when nothing forced was found or
+    no refutation holds (the search has to decide then)
+    """
+    if state.ply == 1:
+        return None
+    search   = ThreatSearch(state, time.perf_counter_ns() + int(max_time_ms * 1000000), threes, maxDepth)
+    me       = 2 if state.ply % 2 else 1
+    opponent = 3 - me
+    stones   = len(state.history)
+    try:
+        wins = five_moves(state, me)
+        if wins:
+            return wins[0], WIN
+        blocks = five_moves(state, opponent)
+        if blocks:
+            return blocks[0], LOSS
+        for withThrees in ((False, True) if threes else (False,)):  # the fours alone first, they are found much faster
+            search.threes = withThrees
+            move = search.attack(me, search.maxDepth)
+            if move is not None:
+                return move, WIN
+            _pass(state)
+            try:
+                move = search.attack(opponent, search.maxDepth)
+            finally:
+                while len(state.history) > stones:
+                    state.pop()
+                _pass(state, back=True)
+            if move is not None:
+                block = _refutation(search, opponent, move)
+                return (block, LOSS) if block is not None else None
+    except _Timeout:
+        while len(state.history) > stones:
+            state.pop()
+    return None
+
+
+if __name__ == "__main__":
+    # the positions of GmQuickTests (with ply and the correct answers), for both colours
+    positions = {
+        "WinSelf1":        ({(3, 0): 2, (4, 0): 2, (5, 0): 2, (6, 0): 2}, 5, [(2, 0)]),
+        "PreventWinOther1": ({(3, 0): 1, (4, 0): 1, (5, 0): 1, (6, 0): 1}, 5, [(2, 0)]),
+        "WinSelf2":        ({(2, 0): 2, (3, 0): 2, (4, 0): 2, (5, 0): 2}, 5, [(1, 0), (6, 0)]),
+        "PreventWinOther2": ({(2, 0): 1, (3, 0): 1, (4, 0): 1, (5, 0): 1}, 5, [(1, 0), (6, 0)]),
+        "WinSelf3":        ({(3, 0): 2, (4, 0): 2, (5, 0): 2, (6, 0): 2, (3, 6): 1, (4, 6): 1, (5, 6): 1, (6, 6): 1}, 9, [(2, 0)]),
+        "PreventAdvanced1": ({(2, 0): 1, (3, 0): 1, (4, 0): 1, (6, 6): 2}, 5, [(1, 0), (5, 0)]),
+    }
+    for name, (stones, ply, good) in positions.items():
+        for swap in (False, True):
+            board = np.zeros((7, 7), dtype=np.int8)
+            for cell, colour in stones.items():
+                board[cell] = 3 - colour if swap else colour
+            state = gomoku.SearchState((board, ply + swap))
+            start = time.perf_counter()
+            found = forced_move(state)
+            ms    = (time.perf_counter() - start) * 1000
+            print("%-17s %-5s %-14s %6.2f ms  %s" % (name, "white" if swap else "black", found, ms, "correct" if found and found[0] in good else "WRONG"))
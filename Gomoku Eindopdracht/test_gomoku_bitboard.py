@@ -0,0 +1,5 @@
+import gomoku_bitboard
+
+
+def test_bitboard_engine_matches_numpy_engine():
+    assert gomoku_bitboard.test_equivalence(nof_games=100)